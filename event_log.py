@@ -0,0 +1,205 @@
+"""
+구조화 로그 / 알림 감사 기록 모듈
+
+요청을 처리하는 스레드는 로그 항목을 대기열에 넣기만 하고,
+JSON 변환과 stdout/파일 쓰기는 프로세스마다 하나 있는 백그라운드 스레드가 맡는다.
+
+- 로그: stdout 에 JSON 한 줄씩 {"ts", "level", "event", "msg", ...}
+- 감사 기록: 알림 한 건마다 AUDIT_LOG_FILE 에 JSON 한 줄 추가 (추가 전용)
+  logrotate 등으로 파일이 옮겨지면 다음 쓰기에서 새 파일을 연다.
+  여러 워커가 같은 파일에 O_APPEND 로 한 줄씩 쓰므로 줄이 섞이지 않는다.
+- recent_audit(): 감사 파일 끝부분만 읽어 최근 기록 조회 (모든 워커의 기록)
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime
+
+# 출력할 최소 로그 수준 (debug, info, warning, error)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'info').lower()
+
+# 알림 감사 기록 파일
+AUDIT_LOG_FILE = os.getenv('AUDIT_LOG_FILE', os.path.join('logs', 'send_audit.jsonl'))
+
+# 대기열 최대 크기 (가득 차면 요청을 막지 않고 버린 뒤 건수만 기록)
+LOG_QUEUE_SIZE = 10000
+
+_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+_min_level = _LEVELS.get(LOG_LEVEL, 20)
+
+_writer = {'queue': None, 'pid': None, 'dropped': 0}
+_writer_lock = threading.Lock()
+
+def mask_phone(phone):
+    """로그용 전화번호 가리기 (010-****-5678)"""
+    digits = ''.join(ch for ch in str(phone or '') if ch.isdigit())
+    if len(digits) < 8:
+        return '*' * len(digits)
+    return f"{digits[:3]}-****-{digits[-4:]}"
+
+def _queue():
+    """
+    로그 대기열 (프로세스당 1개, 처음 쓸 때 기록 스레드 시작)
+    
+    gunicorn --preload 로 fork된 워커에는 마스터의 스레드가 없으므로 pid를 보고 새로 만든다.
+    """
+    if _writer['pid'] == os.getpid():
+        return _writer['queue']
+    with _writer_lock:
+        if _writer['pid'] != os.getpid():
+            entries = queue.Queue(LOG_QUEUE_SIZE)
+            threading.Thread(target=_write_loop, args=(entries,), name='event-log', daemon=True).start()
+            _writer['queue'] = entries
+            _writer['dropped'] = 0
+            _writer['pid'] = os.getpid()
+        return _writer['queue']
+
+def _put(kind, entry):
+    try:
+        _queue().put_nowait((kind, entry))
+    except queue.Full:
+        _writer['dropped'] += 1
+
+def log(event, message='', level='info', **fields):
+    """
+    구조화 로그 남기기 (즉시 반환)
+    
+    Args:
+        event: 이벤트 이름 (예: 'sms.failed', 'roster.read_error')
+        message: 사람이 읽을 설명
+        level: debug, info, warning, error
+        fields: 함께 남길 값 (JSON으로 변환 가능한 값)
+    """
+    if _LEVELS.get(level, 20) < _min_level:
+        return
+    entry = {'ts': time.time(), 'level': level, 'event': event, 'pid': os.getpid()}
+    if message:
+        entry['msg'] = message
+    entry.update(fields)
+    _put('log', entry)
+
+def audit(**fields):
+    """알림 감사 기록 한 줄 추가 (즉시 반환)"""
+    entry = {'ts': time.time()}
+    entry.update(fields)
+    _put('audit', entry)
+
+def _format(entry):
+    entry = dict(entry, ts=datetime.fromtimestamp(entry['ts']).isoformat(timespec='milliseconds'))
+    return json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+
+class _AuditFile:
+    """추가 전용 감사 파일 (파일이 옮겨지거나 지워지면 다시 엶)"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.inode = None
+    
+    def write(self, lines):
+        try:
+            stat = os.stat(self.path)
+            inode = (stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            inode = None
+        if self.fd is None or inode != self.inode:
+            if self.fd is not None:
+                os.close(self.fd)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            stat = os.fstat(self.fd)
+            self.inode = (stat.st_dev, stat.st_ino)
+        # 버퍼 없이 한 번의 write 로 추가 (다른 워커의 기록과 줄 단위로 섞이지 않음)
+        os.write(self.fd, ''.join(lines).encode('utf-8'))
+
+def _write_loop(entries):
+    """대기열을 모아서 stdout/감사 파일에 기록 (데몬 스레드)"""
+    audit_file = _AuditFile(AUDIT_LOG_FILE)
+    while True:
+        batch = [entries.get()]
+        while len(batch) < 500:
+            try:
+                batch.append(entries.get_nowait())
+            except queue.Empty:
+                break
+        
+        if _writer['dropped']:
+            dropped, _writer['dropped'] = _writer['dropped'], 0
+            batch.append(('log', {'ts': time.time(), 'level': 'warning', 'event': 'log.dropped',
+                                  'pid': os.getpid(), 'count': dropped}))
+        
+        log_lines = [_format(entry) for kind, entry in batch if kind == 'log']
+        audit_lines = [_format(entry) for kind, entry in batch if kind == 'audit']
+        try:
+            if log_lines:
+                sys.stdout.write(''.join(log_lines))
+                sys.stdout.flush()
+            if audit_lines:
+                audit_file.write(audit_lines)
+        except (OSError, ValueError) as e:
+            sys.stderr.write(f"로그 기록 오류: {e}\n")
+        finally:
+            for _ in batch:
+                entries.task_done()
+
+def flush(timeout=2.0):
+    """대기 중인 로그를 기록할 때까지 잠시 대기 (종료 시, 테스트용)"""
+    if _writer['pid'] != os.getpid():
+        return
+    deadline = time.time() + timeout
+    while _writer['queue'].unfinished_tasks and time.time() < deadline:
+        time.sleep(0.01)
+
+atexit.register(flush)
+
+def recent_audit(limit=50, **filters):
+    """
+    최근 감사 기록 조회 (파일 끝에서부터 읽음)
+    
+    Args:
+        limit: 최대 건수
+        filters: 필드 값이 같은 기록만 (예: student_name='홍길동', config_file=None)
+    
+    Returns:
+        list: 최신 기록이 앞에 오는 dict 목록
+    """
+    results = []
+    for line in _read_lines_reversed(AUDIT_LOG_FILE):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if all(entry.get(key) == value for key, value in filters.items()):
+            results.append(entry)
+            if len(results) >= limit:
+                break
+    return results
+
+def _read_lines_reversed(path, chunk_size=64 * 1024):
+    """파일을 끝에서부터 한 줄씩 (큰 파일도 필요한 만큼만 읽음)"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+        while position > 0:
+            size = min(chunk_size, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + remainder).split(b'\n')
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line.decode('utf-8', errors='replace')
+        if remainder.strip():
+            yield remainder.decode('utf-8', errors='replace')
@@ -0,0 +1,57 @@
+"""
+gunicorn 실행 설정
+
+    gunicorn -c gunicorn.conf.py "web_app:create_app()"
+
+환경 변수로 조정:
+- WEB_CONCURRENCY: 워커 프로세스 수 (기본: CPU 수, 최대 4)
+- GUNICORN_WORKER_CLASS: gthread(기본) 또는 gevent (아래 참고)
+- GUNICORN_THREADS: gthread 워커당 스레드 수 (기본 8)
+- GUNICORN_WORKER_CONNECTIONS: gevent 워커당 동시 연결 수 (기본 200)
+
+워커 방식 선택:
+- gthread: 등원/하원/납입 등 엑셀에 쓰는 요청이 있는 운영 환경은 모두 이쪽.
+- gevent: 쓰기 요청이 있는 환경에서는 지원하지 않는다. 엑셀 파일 잠금(fcntl.flock)과
+  openpyxl 읽기/저장은 gevent가 양보시킬 수 없는 blocking 호출이라, 다른 워커의 저장을
+  기다리거나 저장하는 동안 그 워커의 모든 연결이 함께 멈춘다. (조회 전용 시험용)
+엑셀 저장은 지점별 잠금 + 파일 잠금으로 한 번에 하나씩만 일어나므로
+워커 수를 늘려도 기록이 섞이지는 않지만, 저장 자체가 빨라지지는 않는다.
+"""
+
+import os
+import multiprocessing
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+# gevent 워커는 다른 모듈(threading, socket, sqlite 대기 등)보다 먼저 패치해야 한다
+if worker_class == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '200'))
+
+# 마스터에서 앱을 한 번 만들고(설정/명단 캐시 준비) 워커로 fork
+preload_app = True
+
+def on_starting(server):
+    if worker_class == 'gevent':
+        server.log.warning("gevent 워커는 엑셀 저장 중 워커 전체가 멈춥니다. 등원/하원 운영에는 gthread 를 사용하세요.")
+
+def post_fork(server, worker):
+    # 재시작/배포 전에 보낸 메시지의 수신 결과도 조회되도록 워커가 뜨자마자 폴러 시작
+    # (preload 로 마스터에서 만든 스레드는 fork된 워커에 없음)
+    from sms_sender import start_delivery_poller
+    start_delivery_poller()
+
+# 태블릿이 주기적으로 새로고침하므로 연결을 조금 길게 유지
+keepalive = 5
+
+# 엑셀 저장이 오래 걸리는 큰 명단도 끊기지 않도록
+timeout = 60
+graceful_timeout = 30
+
+accesslog = '-'
@@ -0,0 +1,528 @@
+"""
+태블릿 여러 대 부하 테스트
+
+실제 템플릿의 요청 패턴을 흉내 내어 로컬 서버(gunicorn 워커 여러 개)에 부하를 주고,
+처리량과 지연 시간(p50/p95/p99)을 보고한 뒤
+엑셀 명단이 기대 상태와 같은지(사라진/중복된 기록이 없는지) 확인한다.
+
+- 데스크 태블릿(index.html): 5초마다 / 새로고침, 등원/하원/납입 버튼 (성공하면 1.5초 뒤 새로고침)
+- 모바일(mobile.html): 페이지를 열 때 /api/students 한 번, 버튼마다 /api/sync (응답의 목록으로 화면 갱신),
+  가끔 당겨서 새로고침, 연결이 끊긴 동안은 작업을 모았다가 한 번에 전송 (실패하면 간격을 늘려 재시도)
+
+사용법:
+    python load_test.py --tablets 8 --mobile 2 --workers 3 --duration 60
+    python load_test.py --students 500          # 가상 학생 500명 명단으로 테스트
+    python load_test.py --shared                # 모든 태블릿이 모든 학생을 누름 (충돌 많음)
+    python load_test.py --url http://host:5000 --allow-live
+                                                # 이미 떠 있는 서버 대상 (파일/메시지 DB 검증 생략)
+                                                # 실제 문자가 발송되고 납입일이 바뀌므로 시험용 서버에만
+
+원본 엑셀은 건드리지 않고 임시 폴더에 복사해서 사용한다.
+메시지는 시뮬레이터 프로바이더(기본) 또는 --test-mode 로 실제 전송 없이 기록된다.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+import importlib.util
+
+import requests
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 템플릿의 새로고침 주기(초)와 버튼 성공 후 새로고침까지 대기(초)
+RELOAD_INTERVAL = 5
+RELOAD_AFTER_TAP = 1.5
+
+# 납입 버튼 비율 (나머지는 등원/하원)
+PAYMENT_RATIO = 0.1
+
+# 모바일: 당겨서 새로고침 평균 간격(초), 버튼을 누를 때 연결이 끊겨 있을 확률과 끊긴 시간(초)
+PULL_REFRESH_INTERVAL = 60
+OFFLINE_RATIO = 0.1
+OFFLINE_SECONDS = (3, 10)
+
+# mobile.html 의 전송 실패 재시도 간격(초, 실패할 때마다 두 배)
+RETRY_MIN = 2
+RETRY_MAX = 60
+
+# 서버가 뜰 때까지 기다리는 시간(초)
+STARTUP_TIMEOUT = 30
+
+class Stats:
+    """요청 종류별 지연 시간 기록 (여러 스레드에서 호출)"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+    
+    def timed(self, label, func, *args, **kwargs):
+        """요청 하나를 실행하고 걸린 시간 기록, 실패하면 None 반환"""
+        started = time.perf_counter()
+        try:
+            response = func(*args, **kwargs)
+            ok = response.status_code < 500
+        except requests.RequestException:
+            response, ok = None, False
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies.setdefault(label, []).append(elapsed)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+        return response if ok else None
+
+def percentile(sorted_values, p):
+    """정렬된 목록의 백분위수 (nearest-rank)"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+# ===== 기대 상태 장부 =====
+# 학생(행)마다 초기 상태와 서버가 "성공"이라고 답한 변경을 모아 두고,
+# 끝난 뒤 실제 명단과 비교한다.
+
+def new_ledger(students):
+    return {
+        s['row']: {
+            'name': s['name'],
+            'phone': s.get('phone'),
+            'initial': s['status'],
+            'initial_payment': s.get('payment_date'),
+            'expected': s['status'],
+            'checkin': 0,
+            'checkout': 0,
+            'rejected': 0,
+            'payments': [],
+        }
+        for s in students
+    }
+
+def record_result(ledger, lock, row, kind, success, payment_date=None):
+    """서버 응답을 장부에 반영"""
+    with lock:
+        entry = ledger[row]
+        if not success:
+            entry['rejected'] += 1
+        elif kind == 'payment':
+            entry['payments'].append(payment_date)
+        else:
+            entry[kind] += 1
+            entry['expected'] = 1 if kind == 'checkin' else 0
+
+def choose_action(ledger, lock, rows, belief=None):
+    """다음에 누를 학생과 버튼 선택 (현재 상태의 반대 버튼)"""
+    row = random.choice(rows)
+    if random.random() < PAYMENT_RATIO:
+        return row, 'payment'
+    with lock:
+        status = belief.get(row, ledger[row]['expected']) if belief is not None else ledger[row]['expected']
+    return row, 'checkout' if status == 1 else 'checkin'
+
+# ===== 태블릿 시뮬레이션 =====
+
+def desk_tablet(index, url, rows, ledger, lock, stats, deadline, tap_interval):
+    """데스크 태블릿 (index.html): 주기적 새로고침 + 버튼"""
+    session = requests.Session()
+    next_reload = time.time()
+    next_tap = time.time() + random.expovariate(1 / tap_interval)
+    seq = 0
+    
+    while time.time() < deadline:
+        now = time.time()
+        if now >= next_reload:
+            stats.timed('GET /', session.get, f"{url}/")
+            next_reload = now + RELOAD_INTERVAL
+        
+        if now >= next_tap:
+            row, kind = choose_action(ledger, lock, rows)
+            if kind == 'payment':
+                seq += 1
+                payment_date = f"LT-{index}-{seq}"
+                response = stats.timed('POST /api/payment', session.post, f"{url}/api/payment/{row}",
+                                       json={'payment_date': payment_date})
+            else:
+                payment_date = None
+                response = stats.timed(f'POST /api/{kind}', session.post, f"{url}/api/{kind}/{row}")
+            
+            if response is not None:
+                success = bool(response.json().get('success'))
+                record_result(ledger, lock, row, kind, success, payment_date)
+                if success:
+                    next_reload = time.time() + RELOAD_AFTER_TAP
+            next_tap = time.time() + random.expovariate(1 / tap_interval)
+        
+        time.sleep(max(0, min(next_reload, next_tap, deadline) - time.time()))
+
+def mobile_tablet(index, url, rows, ledger, lock, stats, deadline, tap_interval):
+    """
+    모바일 (mobile.html): 주기적으로 목록을 조회하지 않고 버튼마다 대기열을 /api/sync 로 전송
+    
+    연결이 끊긴 동안 누른 작업은 모아 두었다가 연결이 돌아오면('online') 한 번에 보낸다.
+    """
+    session = requests.Session()
+    queue = []
+    belief = {}  # 대기열 작업을 반영한 화면 상태 (applyPending)
+    etag = None
+    offline_until = 0
+    next_flush = None
+    retry_delay = RETRY_MIN
+    next_pull = time.time() + random.expovariate(1 / PULL_REFRESH_INTERVAL)
+    next_tap = time.time() + random.expovariate(1 / tap_interval)
+    seq = 0
+    
+    def fetch_roster():
+        nonlocal etag
+        headers = {'If-None-Match': etag} if etag else {}
+        response = stats.timed('GET /api/students', session.get, f"{url}/api/students", headers=headers)
+        if response is not None and response.status_code == 200:
+            etag = response.headers.get('ETag')
+    
+    # 페이지 열기: 대기열 전송(비어 있음) 후 서버 목록
+    fetch_roster()
+    
+    while time.time() < deadline:
+        now = time.time()
+        pull = False
+        
+        if now >= next_tap:
+            row, kind = choose_action(ledger, lock, rows, belief)
+            seq += 1
+            op = {'id': f"m{index}-{seq}", 'op': kind, 'row': row, 'name': ledger[row]['name']}
+            if kind == 'payment':
+                op['payment_date'] = f"LT-m{index}-{seq}"
+            else:
+                belief[row] = 1 if kind == 'checkin' else 0
+            queue.append(op)
+            if random.random() < OFFLINE_RATIO:
+                offline_until = max(offline_until, now + random.uniform(*OFFLINE_SECONDS))
+            # 누르자마자 전송 (끊겨 있으면 연결이 돌아올 때)
+            next_flush = max(now, offline_until)
+            next_tap = now + random.expovariate(1 / tap_interval)
+        
+        if now >= next_pull:
+            if now < offline_until:
+                next_pull = offline_until
+            else:
+                # 당겨서 새로고침: 대기열 전송 후 목록 조회
+                pull = True
+                next_flush = now
+                next_pull = now + random.expovariate(1 / PULL_REFRESH_INTERVAL)
+        
+        if next_flush is not None and now >= next_flush:
+            if flush_queue(url, session, queue, belief, ledger, lock, stats):
+                next_flush = None
+                retry_delay = RETRY_MIN
+            else:
+                next_flush = time.time() + retry_delay
+                retry_delay = min(retry_delay * 2, RETRY_MAX)
+        
+        if pull:
+            fetch_roster()
+        
+        wake = [next_tap, next_pull, deadline] + ([next_flush] if next_flush is not None else [])
+        time.sleep(max(0, min(wake) - time.time()))
+    
+    flush_queue(url, session, queue, belief, ledger, lock, stats)
+
+def flush_queue(url, session, queue, belief, ledger, lock, stats):
+    """대기열 전송 (비어 있거나 서버가 받으면 True, 실패하면 대기열 유지 후 False)"""
+    if not queue:
+        return True
+    response = stats.timed('POST /api/sync', session.post, f"{url}/api/sync", json={'operations': queue})
+    if response is None:
+        return False  # 실패하면 대기열 유지 (다음에 다시 전송)
+    data = response.json()
+    if not data.get('success'):
+        return False
+    
+    by_id = {op['id']: op for op in queue}
+    for result in data['results']:
+        op = by_id.get(result['id'])
+        if op:
+            record_result(ledger, lock, op['row'], op['op'], result['status'] == 'applied', op.get('payment_date'))
+    queue.clear()
+    
+    # 서버 상태가 기준 (충돌이 난 작업의 화면 상태도 되돌림)
+    belief.clear()
+    return True
+
+# ===== 로컬 서버 =====
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def make_roster(path, count):
+    """가상 학생 명단 엑셀 생성"""
+    import openpyxl
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['이름', '전화번호', '상태', '납입일'])
+    for i in range(count):
+        ws.append([f"학생{i + 1:04d}", f"010-9{i // 10000:03d}-{i % 10000:04d}", 0, None])
+    wb.save(path)
+
+def prepare_workdir(args):
+    """임시 폴더에 명단/설정 복사"""
+    workdir = tempfile.mkdtemp(prefix='attendance-load-')
+    excel_file = os.path.join(workdir, 'roster.xlsx')
+    
+    if args.students:
+        make_roster(excel_file, args.students)
+        config = {'academy_name': '부하테스트학원', 'name_column': 'A', 'phone_column': 'B',
+                  'status_column': 'C', 'payment_column': 'D', 'start_row': 2}
+        with open(os.path.join(workdir, 'config.json'), 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False)
+    else:
+        shutil.copy(args.excel, excel_file)
+        for name in ('config.json', 'example_config.json'):
+            if os.path.exists(os.path.join(BASE_DIR, name)):
+                shutil.copy(os.path.join(BASE_DIR, name), os.path.join(workdir, 'config.json'))
+                break
+    
+    sms_config = {'provider': 'simulator', 'message_type': 'sms', 'test_mode': args.test_mode}
+    with open(os.path.join(workdir, 'sms_config.json'), 'w', encoding='utf-8') as f:
+        json.dump(sms_config, f)
+    return workdir
+
+def start_server(args, workdir, port):
+    """gunicorn(없으면 Flask 개발 서버)으로 앱 실행"""
+    env = os.environ.copy()
+    for key in ('ACADEMY_NAME', 'SMS_PROVIDER'):
+        env.pop(key, None)
+    env.update({
+        'EXCEL_FILE': os.path.join(workdir, 'roster.xlsx'),
+        'CONFIG_FILE': os.path.join(workdir, 'config.json'),
+        'MESSAGE_DB_FILE': os.path.join(workdir, 'messages.db'),
+        'QR_SECRET_FILE': os.path.join(workdir, 'qr_secret.key'),
+        'QR_CODE_DIR': os.path.join(workdir, 'qr_codes'),
+        'BRANCH_DIR': os.path.join(workdir, 'branches'),
+        'PORT': str(port),
+        'WEB_CONCURRENCY': str(args.workers),
+        'GUNICORN_WORKER_CLASS': args.worker_class,
+        'PYTHONPATH': BASE_DIR + os.pathsep + env.get('PYTHONPATH', ''),
+    })
+    
+    if importlib.util.find_spec('gunicorn'):
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BASE_DIR, 'gunicorn.conf.py'),
+                   '--access-logfile', os.devnull, 'web_app:create_app()']
+    else:
+        print("⚠️ gunicorn이 없어 Flask 개발 서버(프로세스 1개, 스레드)로 실행합니다.")
+        command = [sys.executable, '-c',
+                   f"from web_app import create_app; create_app().run(host='127.0.0.1', port={port}, threaded=True)"]
+    
+    log = open(os.path.join(workdir, 'server.log'), 'w', encoding='utf-8')
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    
+    url = f"http://127.0.0.1:{port}"
+    started = time.time()
+    while time.time() - started < STARTUP_TIMEOUT:
+        if process.poll() is not None:
+            raise RuntimeError(f"서버 시작 실패 (로그: {log.name})")
+        try:
+            if requests.get(f"{url}/api/students", timeout=2).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"서버가 {STARTUP_TIMEOUT}초 안에 응답하지 않음 (로그: {log.name})")
+
+# ===== 결과 확인 =====
+
+def read_disk_roster(excel_file, config_file):
+    """엑셀 파일에서 직접 상태/납입일 읽기 (서버 캐시와 무관한 실제 저장 내용)"""
+    import openpyxl
+    from openpyxl.utils import column_index_from_string
+    from web_app import parse_status
+    
+    with open(config_file, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    status_index = column_index_from_string(config['status_column']) - 1
+    payment_index = column_index_from_string(config['payment_column']) - 1
+    
+    wb = openpyxl.load_workbook(excel_file, read_only=True)
+    roster = {}
+    for row, values in enumerate(wb.active.iter_rows(min_row=config['start_row'], values_only=True),
+                                 start=config['start_row']):
+        if values and values[0]:
+            roster[row] = {'status': parse_status(values[status_index]), 'payment_date': values[payment_index]}
+    wb.close()
+    return roster
+
+def count_messages(db_file):
+    """학생별 알림 기록 수, 상태별 건수"""
+    if not os.path.exists(db_file):
+        return {}, {}
+    conn = sqlite3.connect(db_file)
+    per_student = {}
+    # 형제 알림은 한 건에 이름이 묶여 있음 ("A, B")
+    for names, count in conn.execute("SELECT student_name, COUNT(*) FROM messages GROUP BY student_name"):
+        for name in (names or '').split(', '):
+            per_student[name] = per_student.get(name, 0) + count
+    per_status = dict(conn.execute("SELECT status, COUNT(*) FROM messages GROUP BY status").fetchall())
+    conn.close()
+    return per_student, per_status
+
+def verify(ledger, final, shared, messages=None):
+    """
+    장부와 최종 명단 비교
+    
+    - 중복 반영: 등원 성공 횟수 - 하원 성공 횟수가 0/1 범위를 벗어남 (같은 상태로 두 번 성공)
+    - 사라진 기록: 최종 상태가 초기 상태 + 성공한 변경과 다름, 또는 마지막 납입일이 남아 있지 않음
+    - 전담 모드(기본)에서는 한 학생을 한 태블릿만 누르므로 거절 응답도 이상으로 본다
+    """
+    problems = {'lost': [], 'duplicated': [], 'rejected': [], 'notifications': []}
+    
+    for row, entry in ledger.items():
+        expected = entry['initial'] + entry['checkin'] - entry['checkout']
+        actual = final.get(row, {})
+        
+        if expected not in (0, 1):
+            problems['duplicated'].append(f"{entry['name']}: 등원 {entry['checkin']}회/하원 {entry['checkout']}회 성공")
+        elif actual.get('status') != expected:
+            problems['lost'].append(f"{entry['name']}: 상태 {actual.get('status')} (기대 {expected})")
+        
+        if entry['payments']:
+            payment = actual.get('payment_date')
+            if shared:
+                ok = payment in entry['payments']
+            else:
+                ok = payment == entry['payments'][-1]
+            if not ok:
+                problems['lost'].append(f"{entry['name']}: 납입일 {payment!r} (기대 {entry['payments'][-1]!r})")
+        
+        if not shared and entry['rejected']:
+            problems['rejected'].append(f"{entry['name']}: 거절 {entry['rejected']}회")
+        
+        if messages is not None and entry['phone']:
+            sent = messages.get(entry['name'], 0)
+            changes = entry['checkin'] + entry['checkout']
+            if sent != changes:
+                problems['notifications'].append(f"{entry['name']}: 알림 {sent}건 (상태 변경 {changes}회)")
+    
+    return problems
+
+def print_report(stats, elapsed, problems, extra_lines):
+    print()
+    print("=" * 72)
+    print(f"{'요청':<24}{'건수':>8}{'오류':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'최대':>9}")
+    total = 0
+    for label in sorted(stats.latencies):
+        values = sorted(stats.latencies[label])
+        total += len(values)
+        print(f"{label:<24}{len(values):>8}{stats.errors.get(label, 0):>6}"
+              f"{percentile(values, 50) * 1000:>7.1f}ms{percentile(values, 95) * 1000:>7.1f}ms"
+              f"{percentile(values, 99) * 1000:>7.1f}ms{values[-1] * 1000:>7.1f}ms")
+    print("-" * 72)
+    print(f"총 {total}건 / {elapsed:.1f}초 = {total / elapsed:.1f} req/s")
+    for line in extra_lines:
+        print(line)
+    
+    print()
+    labels = {'lost': '사라진 기록', 'duplicated': '중복 반영', 'rejected': '예상치 못한 거절',
+              'notifications': '알림 불일치'}
+    failed = False
+    for key, label in labels.items():
+        items = problems[key]
+        print(f"{'✗' if items else '✓'} {label}: {len(items)}건")
+        for item in items[:10]:
+            print(f"    {item}")
+        failed = failed or bool(items)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description='태블릿 여러 대 부하 테스트')
+    parser.add_argument('--tablets', type=int, default=6, help='데스크 태블릿 수 (index.html)')
+    parser.add_argument('--mobile', type=int, default=2, help='모바일 수 (mobile.html)')
+    parser.add_argument('--duration', type=float, default=30, help='테스트 시간(초)')
+    parser.add_argument('--tap-interval', type=float, default=2.0, help='태블릿당 평균 버튼 간격(초)')
+    parser.add_argument('--workers', type=int, default=3, help='gunicorn 워커 수')
+    parser.add_argument('--worker-class', default='gthread', help='gthread 또는 gevent (gevent 는 쓰기 요청 미지원, 비교용)')
+    parser.add_argument('--excel', default=os.path.join(BASE_DIR, '202511_자동알림.xlsx'), help='복사해서 쓸 명단')
+    parser.add_argument('--students', type=int, default=0, help='가상 학생 수 (지정하면 명단 생성)')
+    parser.add_argument('--shared', action='store_true', help='모든 태블릿이 모든 학생을 누름')
+    parser.add_argument('--test-mode', action='store_true', help='시뮬레이터 대신 테스트 모드로 알림 기록')
+    parser.add_argument('--url', help='이미 실행 중인 서버 주소 (지정하면 서버를 띄우지 않음)')
+    parser.add_argument('--allow-live', action='store_true',
+                        help='--url 서버에 실제 등원/하원/납입 요청을 보내는 것에 동의 (학부모에게 문자 발송됨)')
+    parser.add_argument('--keep', action='store_true', help='임시 폴더 남기기 (로그/엑셀 확인용)')
+    args = parser.parse_args()
+    
+    if args.url and not args.allow_live:
+        parser.error("--url 대상 서버에서는 실제 등원/하원 처리로 학부모에게 문자가 전송되고 "
+                     "납입일이 'LT-…' 값으로 바뀝니다. 시험용(테스트 모드/시뮬레이터) 서버라면 --allow-live 를 함께 지정하세요.")
+    
+    workdir = process = None
+    if args.url:
+        url = args.url.rstrip('/')
+    else:
+        workdir = prepare_workdir(args)
+        process, url = start_server(args, workdir, free_port())
+        print(f"서버 실행: {url} (워커 {args.workers}, 작업 폴더 {workdir})")
+    
+    try:
+        students = requests.get(f"{url}/api/students", timeout=10).json()
+        ledger = new_ledger(students)
+        lock = threading.Lock()
+        stats = Stats()
+        rows = sorted(ledger)
+        
+        # 기본은 학생마다 담당 태블릿 하나 (순서가 정해져 있어 기대 상태를 정확히 알 수 있음)
+        tablets = [(desk_tablet, i) for i in range(args.tablets)] + [(mobile_tablet, i) for i in range(args.mobile)]
+        print(f"학생 {len(rows)}명, 데스크 {args.tablets}대, 모바일 {args.mobile}대, {args.duration:.0f}초")
+        
+        deadline = time.time() + args.duration
+        threads = []
+        for n, (target, index) in enumerate(tablets):
+            own_rows = rows if args.shared else rows[n::len(tablets)]
+            if not own_rows:
+                continue
+            thread = threading.Thread(target=target, args=(index, url, own_rows, ledger, lock, stats,
+                                                           deadline, args.tap_interval), daemon=True)
+            thread.start()
+            threads.append(thread)
+        
+        started = time.time()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+        
+        # 최종 상태: API 응답과 (로컬 서버면) 엑셀 파일 직접 확인
+        final_api = {s['row']: s for s in requests.get(f"{url}/api/students", timeout=10).json()}
+        extra_lines = []
+        messages = None
+        if workdir:
+            final = read_disk_roster(os.path.join(workdir, 'roster.xlsx'), os.path.join(workdir, 'config.json'))
+            stale = [row for row in final if final_api.get(row, {}).get('status') != final[row]['status']]
+            extra_lines.append(f"{'✗' if stale else '✓'} API 응답과 엑셀 파일 불일치: {len(stale)}건")
+            messages, per_status = count_messages(os.path.join(workdir, 'messages.db'))
+            extra_lines.append(f"알림 기록: {per_status}")
+        else:
+            final = final_api
+        
+        problems = verify(ledger, final, args.shared, messages)
+        failed = print_report(stats, elapsed, problems, extra_lines)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+        if workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+알림 문구 템플릿 모듈
+
+등원/하원/원비 안내 문구를 config.json 의 "message_templates" 로 바꿀 수 있다 (없으면 기본 문구).
+설정을 읽을 때 한 번만 시험 렌더링으로 검사해 두고, 같은 학생(들)의 문구는 렌더링 결과를 재사용한다.
+
+렌더링 결과에는 EUC-KR 기준 바이트 길이와 메시지 종류가 함께 들어 있어
+프로바이더에 보낼 때 SMS(90바이트 이하)/LMS 를 미리 정한다.
+
+설정 예:
+    "message_templates": {
+        "checkin": "{quoted_name}님이 \"{academy_name}\"에 등원하였습니다.",
+        "payment_request": {
+            "text": "안녕하세요, {academy_name}입니다.\\n{name}님의 이번 달 원비 납입을 부탁드립니다.",
+            "alimtalk_template_code": "PAY001"
+        }
+    }
+
+사용 가능한 값: {name} (홍길동, 김철수), {quoted_name} ("홍길동", "김철수"), {academy_name}
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+from event_log import log
+
+# 메시지 종류별 최대 바이트 (EUC-KR 기준, 한글 2바이트)
+SMS_MAX_BYTES = 90
+LMS_MAX_BYTES = 2000
+
+DEFAULT_TEMPLATES = {
+    'checkin': '{quoted_name}님이 "{academy_name}"에 등원하였습니다.',
+    'checkout': '{quoted_name}님이 "{academy_name}"에서 하원하였습니다.',
+    'payment_request': '안녕하세요, {academy_name}입니다.\n{name}님의 이번 달 원비 납입을 부탁드립니다.'
+}
+
+# text: 보낼 문구, byte_length: EUC-KR 바이트 수, msg_type: 'SMS' 또는 'LMS',
+# template_code: 알림톡 템플릿 코드 (설정에 없으면 None → 프로바이더 설정의 기본 코드)
+RenderedMessage = namedtuple('RenderedMessage', 'text byte_length msg_type template_code')
+
+def byte_length(text):
+    """문자 메시지 바이트 길이 (EUC-KR, 인코딩할 수 없는 글자는 2바이트로 계산)"""
+    try:
+        return len(text.encode('euc-kr'))
+    except UnicodeEncodeError:
+        return sum(1 if ord(ch) < 128 else 2 for ch in text)
+
+def message_type_for(text):
+    """바이트 길이로 SMS/LMS 결정"""
+    return 'SMS' if byte_length(text) <= SMS_MAX_BYTES else 'LMS'
+
+def _rendered(text, template_code=None):
+    length = byte_length(text)
+    return RenderedMessage(text, length, 'SMS' if length <= SMS_MAX_BYTES else 'LMS', template_code)
+
+def plain_message(text):
+    """템플릿 없이 직접 입력한 문구 (직원이 쓴 원비 안내 등)"""
+    return _rendered(text)
+
+def _format(template, names, academy_name):
+    names = [str(name) for name in names]
+    return template.format(name=', '.join(names), quoted_name=', '.join(f'"{name}"' for name in names),
+                           academy_name=academy_name)
+
+def _compile(kind, source, academy_name):
+    """
+    템플릿 하나 확인: 예시 이름으로 한 번 렌더링해 보고, 오류가 나면 기본 문구 사용
+    
+    등원/하원 문구는 엑셀에 저장한 뒤에 만들므로, 잘못된 설정 값({academy_name:>5}, {name!z} 등)이
+    그때 오류가 되지 않도록 설정을 읽을 때 걸러낸다.
+    
+    Returns:
+        (str, str 또는 None): (format 문자열, 알림톡 템플릿 코드)
+    """
+    if isinstance(source, dict):
+        text = source.get('text', DEFAULT_TEMPLATES.get(kind, ''))
+        template_code = source.get('alimtalk_template_code')
+    else:
+        text, template_code = source, None
+    
+    try:
+        _format(text, ('홍길동', '김철수'), academy_name)
+    except Exception as e:
+        log('template.invalid', "알림 문구 템플릿 오류, 기본 문구 사용", level='warning',
+            kind=kind, error=f"{type(e).__name__}: {e}")
+        text = DEFAULT_TEMPLATES.get(kind, '')
+    
+    return text, template_code or None
+
+class TemplateRegistry:
+    """
+    설정 하나에 대한 컴파일된 문구 모음
+    
+    설정 파일이 바뀌면 load_config 에서 새로 만들어 바꿔 끼운다.
+    """
+    
+    def __init__(self, config):
+        self.academy_name = config.get('academy_name', 'OO학원')
+        overrides = config.get('message_templates') or {}
+        self.templates = {
+            kind: _compile(kind, overrides.get(kind, default), self.academy_name)
+            for kind, default in DEFAULT_TEMPLATES.items()
+        }
+    
+    def render(self, kind, names):
+        """
+        학생(들) 문구 렌더링
+        
+        Args:
+            kind: 'checkin', 'checkout', 'payment_request'
+            names: 학생 이름 목록 (형제 알림은 여러 명)
+        
+        Returns:
+            RenderedMessage
+        """
+        return _render(self, kind, tuple(names))
+
+@lru_cache(maxsize=4096)
+def _render(registry, kind, names):
+    """렌더링 결과 캐시 (같은 학생에게 같은 종류 알림을 반복해서 만들지 않음)"""
+    template, template_code = registry.templates[kind]
+    return _rendered(_format(template, names, registry.academy_name), template_code)
@@ -0,0 +1,52 @@
+"""
+전화번호 정규화 / 검증 모듈
+
+명단을 읽거나 학생을 추가/수정할 때 한 번만 정규화해 두고,
+전송할 때는 이미 정규화된 번호를 그대로 사용한다.
+
+- 정규 형식: 숫자만 (예: 01012345678)
+- 엑셀에서 숫자 셀로 저장돼 앞의 0이 빠진 번호(1012345678)와 +82 국가번호를 복원
+- 문자 수신이 가능한 휴대폰 번호(010, 011, 016~019)만 유효
+"""
+
+import re
+
+_NON_DIGITS = re.compile(r'\D')
+_MOBILE = re.compile(r'^(010\d{8}|01[16789]\d{7,8})$')
+
+def normalize_phone(value):
+    """
+    전화번호를 정규 형식으로 변환
+    
+    Args:
+        value: 셀 값 또는 입력 문자열 (숫자, 하이픈/공백/괄호 포함 문자열, +82 형식)
+    
+    Returns:
+        str 또는 None: 유효한 휴대폰 번호면 숫자만 남긴 번호, 아니면 None
+    """
+    if value is None or value == '':
+        return None
+    
+    # 숫자 셀: 1012345678 / 1012345678.0
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        digits = str(int(value))
+    else:
+        text = str(value).strip()
+        if _MOBILE.match(text):
+            return text
+        digits = _NON_DIGITS.sub('', text)
+    
+    # 국가번호 82 제거 (+82 10..., 82-010-...)
+    if digits.startswith('82') and len(digits) in (11, 12, 13):
+        digits = digits[2:]
+    
+    # 앞의 0이 빠진 휴대폰 번호
+    if digits.startswith('1') and len(digits) in (9, 10):
+        digits = '0' + digits
+    
+    return digits if _MOBILE.match(digits) else None
+
+# 테스트
+if __name__ == "__main__":
+    for sample in ['010-1234-5678', 1012345678, '+82 10 1234 5678', '010589976088', '02-123-4567', '']:
+        print(f"{sample!r} -> {normalize_phone(sample)!r}")
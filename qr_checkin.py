@@ -0,0 +1,153 @@
+"""
+QR 코드 등원/하원 모듈
+
+학생마다 HMAC 서명된 토큰을 QR 코드로 만들어 두고,
+입구 키오스크에서 스캔하면 토큰을 검증해 등원/하원을 처리한다.
+
+- 토큰 형식: "<키 버전>.<학생 ID(base64url)>.<서명>"
+- 학생 ID: config.json 의 id_column 열에 학생마다 임의 값이 기록된다 (web_app.assign_student_ids).
+  id_column 이 없으면 이름으로 서명하는데, 이 경우 동명이인은 키오스크를 쓸 수 없고
+  (스캔마다 직원 확인 필요), 이름을 바꾸면 인쇄한 QR 코드가 무효가 되며,
+  QR 코드 안의 이름을 누구나 읽을 수 있다.
+- QR 이미지는 qr_codes/[<지점>/]v<키 버전>/<학생 키>.png 로 미리 만들어 디스크에 보관
+- 키를 바꾸려면 QR_KEY_VERSION 을 올리면 된다 (이전 버전 토큰은 무효)
+- 지점(scope)별로 서명이 달라, 다른 지점 키오스크에서는 같은 ID/이름이어도 통과하지 않는다
+"""
+
+import os
+import hmac
+import hashlib
+import base64
+import secrets
+import threading
+from functools import lru_cache
+
+# 서명 키 파일 (QR_SECRET 환경 변수가 없을 때 자동 생성)
+QR_SECRET_FILE = os.getenv('QR_SECRET_FILE', 'qr_secret.key')
+
+# QR 이미지 저장 폴더
+QR_CODE_DIR = os.getenv('QR_CODE_DIR', 'qr_codes')
+
+_qr_key = {'secret': None, 'version': None}
+_qr_key_lock = threading.Lock()
+
+def load_qr_key():
+    """
+    QR 서명 키와 키 버전 로드 (환경 변수 우선)
+
+    Returns:
+        tuple: (secret bytes, version int)
+    """
+    if _qr_key['secret'] is None:
+        # 여러 스레드가 동시에 키 파일을 만들지 않도록 잠금
+        with _qr_key_lock:
+            if _qr_key['secret'] is None:
+                secret = os.getenv('QR_SECRET')
+                if not secret:
+                    try:
+                        # 다른 워커 프로세스와 동시에 만들어도 한쪽 키만 남도록 배타적 생성
+                        with open(QR_SECRET_FILE, 'x', encoding='utf-8') as f:
+                            secret = secrets.token_hex(32)
+                            f.write(secret)
+                    except FileExistsError:
+                        with open(QR_SECRET_FILE, 'r', encoding='utf-8') as f:
+                            secret = f.read().strip()
+                _qr_key['version'] = int(os.getenv('QR_KEY_VERSION', '1'))
+                _qr_key['secret'] = secret.encode('utf-8')
+    return _qr_key['secret'], _qr_key['version']
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def _sign(secret, payload, scope=''):
+    message = f"{scope}:{payload}" if scope else payload
+    return _b64(hmac.new(secret, message.encode('utf-8'), hashlib.sha256).digest()[:16])
+
+def student_key(subject):
+    """파일 이름 등에 쓰는 학생 키 (학생 ID/이름 해시)"""
+    return hashlib.sha256(str(subject).encode('utf-8')).hexdigest()[:16]
+
+def make_token(subject, scope=''):
+    """학생 ID(없으면 이름)로 서명된 QR 토큰 생성 (scope: 지점 ID, 기본 지점은 빈 문자열)"""
+    secret, version = load_qr_key()
+    payload = f"{version}.{_b64(str(subject).encode('utf-8'))}"
+    return f"{payload}.{_sign(secret, payload, scope)}"
+
+@lru_cache(maxsize=4096)
+def _verify(token, secret, version, scope):
+    """토큰 검증 결과 캐시 (같은 QR을 다시 스캔하면 HMAC 계산 생략)"""
+    try:
+        token_version, encoded_name, signature = token.split('.')
+        if int(token_version) != version:
+            return None
+        payload = f"{token_version}.{encoded_name}"
+        if not hmac.compare_digest(signature, _sign(secret, payload, scope)):
+            return None
+        return _unb64(encoded_name).decode('utf-8')
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def verify_token(token, scope=''):
+    """
+    QR 토큰 검증
+
+    Returns:
+        str 또는 None: 유효하면 학생 ID (또는 이름)
+    """
+    if not isinstance(token, str) or not token or len(token) > 512:
+        return None
+    secret, version = load_qr_key()
+    return _verify(token.strip(), secret, version, scope)
+
+def qr_png_path(subject, scope=''):
+    """학생 QR 이미지 경로 (지점, 키 버전별 폴더)"""
+    _, version = load_qr_key()
+    return os.path.join(QR_CODE_DIR, scope, f"v{version}", f"{student_key(subject)}.png")
+
+def generate_qr_png(subject, scope=''):
+    """
+    학생 QR 이미지 생성 (이미 있으면 그대로 사용)
+
+    qrcode 패키지가 필요하다 (pip install qrcode[pil]).
+
+    Returns:
+        str: 이미지 경로
+    """
+    path = qr_png_path(subject, scope)
+    if os.path.exists(path):
+        return path
+
+    import qrcode
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image = qrcode.make(make_token(subject, scope))
+
+    # 다른 워커와 동시에 만들어도 깨진 파일이 보이지 않도록 임시 파일 후 교체
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    image.save(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+def pregenerate_qr_codes(subjects, scope=''):
+    """
+    학생 QR 이미지 일괄 생성
+
+    Returns:
+        int: 새로 만든 이미지 수
+    """
+    created = 0
+    for subject in subjects:
+        if not os.path.exists(qr_png_path(subject, scope)):
+            generate_qr_png(subject, scope)
+            created += 1
+    return created
+
+# 테스트
+if __name__ == "__main__":
+    token = make_token('홍길동')
+    print(f"토큰: {token}")
+    print(f"검증: {verify_token(token)}")
+    print(f"위조 검증: {verify_token(token[:-1] + 'A')}")
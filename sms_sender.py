@@ -11,21 +11,119 @@ SMS 및 카카오톡 메시지 전송 모듈
    - 알리고 카카오톡
    - 네이버 클라우드 플랫폼 카카오톡
    - 카카오 비즈니스 API
+
+3. 로컬 시뮬레이터 (provider: simulator, 네트워크 없이 전송/결과 조회 테스트)
+
+전송한 메시지는 프로바이더 요청 ID와 함께 메시지 DB에 기록되고,
+백그라운드 폴러가 각 프로바이더의 결과 조회 API로 실제 수신 여부를 확인한다.
 """
 
-import requests
 import json
 import os
 import hashlib
 import hmac
 import base64
 import time
+import uuid
+import sqlite3
+import queue
+import threading
+from collections import OrderedDict
+
+from event_log import log, audit, mask_phone
+from phone_numbers import normalize_phone
+from message_templates import message_type_for
 
 # SMS API 설정 파일
 SMS_CONFIG_FILE = 'sms_config.json'
 
-def load_sms_config():
-    """SMS 설정 로드 (환경 변수 우선)"""
+# 전송 기록/수신 결과 DB
+MESSAGE_DB_FILE = os.getenv('MESSAGE_DB_FILE', 'messages.db')
+
+# 결과 조회 주기(초), 한 번에 조회할 최대 건수, 조회를 포기하는 시간(초)
+DELIVERY_POLL_INTERVAL = 30
+DELIVERY_POLL_BATCH = 50
+DELIVERY_MAX_AGE = 24 * 60 * 60
+
+# 더 이상 바뀌지 않는 최종 상태
+FINAL_STATUSES = ('test', 'sent', 'delivered', 'failed', 'unknown')
+
+# 프로바이더 API 응답 대기 한도(초)
+HTTP_TIMEOUT = 10
+
+# 발송 대기열을 처리하는 백그라운드 스레드 수 (프로세스당)
+OUTBOUND_WORKERS = int(os.getenv('SMS_OUTBOUND_WORKERS', '2'))
+
+# 'queued' 기록을 맡은 워커가 이 시간(초) 안에 전송을 시작하지 않으면 (재시작/배포로 대기열이
+# 사라진 경우) 다른 워커의 폴러가 가져가서 보낸다
+QUEUED_LEASE_SECONDS = 60
+
+# 이보다 오래된(초) 'queued' 기록은 다시 보내지 않고 unknown 처리 (한참 지난 등원/하원 알림 방지)
+QUEUED_MAX_AGE = 60 * 60
+
+# 'sending' 상태로 이 시간(초)이 지나면 전송 중 중단된 것으로 보고 unknown 처리 (중복 발송 방지로 재전송 안 함)
+SENDING_STALE_SECONDS = 10 * 60
+
+# requests / 쿨SMS SDK는 첫 전송 시에만 로드 (콜드 스타트 단축)
+_http_session = None
+_http_lock = threading.Lock()
+_coolsms_sdk = None
+
+def _http():
+    """공유 HTTP 세션 (지연 로드, 연결 재사용)"""
+    global _http_session
+    if _http_session is None:
+        with _http_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                # 발송 스레드와 폴러가 함께 쓰므로 연결 풀을 스레드 수만큼 확보
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=OUTBOUND_WORKERS + 4)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_session = session
+    return _http_session
+
+def _load_coolsms():
+    """쿨SMS SDK 지연 로드 (성공/실패 결과를 한 번만 확인)"""
+    global _coolsms_sdk
+    if _coolsms_sdk is None:
+        try:
+            from sdk.api.message import Message
+            _coolsms_sdk = Message
+        except ImportError:
+            _coolsms_sdk = False
+    return _coolsms_sdk
+
+# SMS 설정 파일 캐시 {경로: ((수정 시각, 크기), 설정)}
+_sms_config_cache = {}
+
+def _read_sms_config_file(path):
+    """SMS 설정 파일 읽기 (파일이 바뀌지 않았으면 캐시 사용)"""
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _sms_config_cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    _sms_config_cache[path] = (key, config)
+    return config
+
+def load_sms_config(config_file=None):
+    """
+    SMS 설정 로드
+    
+    지점(config_file 지정)은 그 지점의 설정 파일만 사용하고, 파일이 없으면 None을 돌려준다.
+    (다른 학원의 프로바이더 계정/발신 번호로 보내지 않도록 기본 설정으로 대신하지 않음)
+    기본 지점(config_file=None)은 환경 변수, sms_config.json 순으로 사용한다.
+    """
+    if config_file:
+        if os.path.exists(config_file):
+            return _read_sms_config_file(config_file)
+        return None
+    
     # 환경 변수에서 먼저 읽기 (Render, Railway 등 호스팅 서비스용)
     if os.getenv('SMS_PROVIDER'):
         return {
@@ -52,12 +150,11 @@ def load_sms_config():
     
     # 로컬 환경에서는 sms_config.json 사용
     if os.path.exists(SMS_CONFIG_FILE):
-        with open(SMS_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return _read_sms_config_file(SMS_CONFIG_FILE)
     else:
         # 기본 설정 파일 생성
         default_config = {
-            "provider": "naver",  # naver, coolsms, aligo, kakao_aligo, kakao_naver, kakao_business
+            "provider": "naver",  # naver, coolsms, aligo, kakao_aligo, kakao_naver, kakao_business, simulator
             "test_mode": True,  # 테스트 모드 (실제 전송 안함)
             "message_type": "sms",  # sms 또는 kakao
             
@@ -113,39 +210,41 @@ def load_sms_config():
         
         return default_config
 
-def send_sms_naver(phone, message, config):
-    """네이버 클라우드 플랫폼 SENS를 통한 SMS 전송"""
-    service_id = config['naver']['service_id']
-    access_key = config['naver']['access_key']
-    secret_key = config['naver']['secret_key']
-    sender_phone = config['naver']['sender_phone']
-    
-    # API 요청 URL
-    url = f"https://sens.apigw.ntruss.com/sms/v2/services/{service_id}/messages"
-    
+def _ncp_headers(method, uri, access_key, secret_key):
+    """네이버 클라우드 플랫폼 API 요청 헤더 (시그니처 생성)"""
     # 타임스탬프
     timestamp = str(int(time.time() * 1000))
     
     # 시그니처 생성
-    method = "POST"
-    uri = f"/sms/v2/services/{service_id}/messages"
     message_bytes = method + " " + uri + "\n" + timestamp + "\n" + access_key
     message_bytes = bytes(message_bytes, 'UTF-8')
     secret_key_bytes = bytes(secret_key, 'UTF-8')
     
     signing_key = base64.b64encode(hmac.new(secret_key_bytes, message_bytes, digestmod=hashlib.sha256).digest())
     
-    # 헤더
-    headers = {
+    return {
         'Content-Type': 'application/json; charset=utf-8',
         'x-ncp-apigw-timestamp': timestamp,
         'x-ncp-iam-access-key': access_key,
         'x-ncp-apigw-signature-v2': signing_key
     }
+
+def send_sms_naver(phone, message, config, msg_type='SMS'):
+    """네이버 클라우드 플랫폼 SENS를 통한 SMS/LMS 전송"""
+    service_id = config['naver']['service_id']
+    access_key = config['naver']['access_key']
+    secret_key = config['naver']['secret_key']
+    sender_phone = config['naver']['sender_phone']
+    
+    # API 요청 URL
+    url = f"https://sens.apigw.ntruss.com/sms/v2/services/{service_id}/messages"
+    
+    # 헤더 (시그니처 포함)
+    headers = _ncp_headers("POST", f"/sms/v2/services/{service_id}/messages", access_key, secret_key)
     
     # 요청 본문
     body = {
-        "type": "SMS",
+        "type": msg_type,
         "contentType": "COMM",
         "countryCode": "82",
         "from": sender_phone,
@@ -156,33 +255,38 @@ def send_sms_naver(phone, message, config):
             }
         ]
     }
+    if msg_type == 'LMS':
+        body["subject"] = "학원 알림"
     
     try:
-        response = requests.post(url, headers=headers, json=body)
+        response = _http().post(url, headers=headers, json=body, timeout=HTTP_TIMEOUT)
         if response.status_code == 202:
-            return True
+            return response.json().get('requestId') or True
         else:
-            print(f"네이버 SMS 전송 실패: {response.status_code}, {response.text}")
+            log('sms.provider_failed', "네이버 SMS 전송 실패", level='warning',
+                http_status=response.status_code, response=response.text[:500])
             return False
     except Exception as e:
-        print(f"네이버 SMS 전송 오류: {e}")
+        log('sms.provider_error', "네이버 SMS 전송 오류", level='error', error=str(e))
         return False
 
-def send_sms_coolsms(phone, message, config):
-    """쿨SMS를 통한 SMS 전송"""
+def send_sms_coolsms(phone, message, config, msg_type='SMS'):
+    """쿨SMS를 통한 SMS/LMS 전송"""
     # 쿨SMS SDK 사용 시
     # pip install coolsms-python 필요
     
+    Message = _load_coolsms()
+    if not Message:
+        log('sms.sdk_missing', "쿨SMS SDK가 설치되지 않았습니다. pip install coolsms-python", level='error')
+        return False
+    
     try:
-        from sdk.api.message import Message
-        from sdk.exceptions import CoolsmsException
-        
         api_key = config['coolsms']['api_key']
         api_secret = config['coolsms']['api_secret']
         sender_phone = config['coolsms']['sender_phone']
         
         params = {
-            'type': 'sms',
+            'type': msg_type.lower(),
             'to': phone,
             'from': sender_phone,
             'text': message
@@ -191,16 +295,15 @@ def send_sms_coolsms(phone, message, config):
         cool = Message(api_key, api_secret)
         response = cool.send(params)
         
+        if isinstance(response, dict) and response.get('group_id'):
+            return response['group_id']
         return True
-    except ImportError:
-        print("쿨SMS SDK가 설치되지 않았습니다. pip install coolsms-python")
-        return False
     except Exception as e:
-        print(f"쿨SMS 전송 오류: {e}")
+        log('sms.provider_error', "쿨SMS 전송 오류", level='error', error=str(e))
         return False
 
-def send_sms_aligo(phone, message, config):
-    """알리고를 통한 SMS 전송"""
+def send_sms_aligo(phone, message, config, msg_type='SMS'):
+    """알리고를 통한 SMS/LMS 전송"""
     api_key = config['aligo']['api_key']
     user_id = config['aligo']['user_id']
     sender_phone = config['aligo']['sender_phone']
@@ -213,29 +316,29 @@ def send_sms_aligo(phone, message, config):
         'sender': sender_phone,
         'receiver': phone,
         'msg': message,
-        'msg_type': 'SMS',
+        'msg_type': msg_type,
         'title': '학원 알림'
     }
     
     try:
-        response = requests.post(url, data=data)
+        response = _http().post(url, data=data, timeout=HTTP_TIMEOUT)
         result = response.json()
         
-        if result.get('result_code') == '1':
-            return True
+        if str(result.get('result_code')) == '1':
+            return str(result.get('msg_id') or '') or True
         else:
-            print(f"알리고 SMS 전송 실패: {result}")
+            log('sms.provider_failed', "알리고 SMS 전송 실패", level='warning', response=result)
             return False
     except Exception as e:
-        print(f"알리고 SMS 전송 오류: {e}")
+        log('sms.provider_error', "알리고 SMS 전송 오류", level='error', error=str(e))
         return False
 
-def send_kakao_aligo(phone, message, student_name, config):
+def send_kakao_aligo(phone, message, student_name, config, template_code=None):
     """알리고 카카오톡 알림톡 전송"""
     api_key = config['kakao_aligo']['api_key']
     user_id = config['kakao_aligo']['user_id']
     sender_key = config['kakao_aligo']['sender_key']
-    template_code = config['kakao_aligo']['template_code']
+    template_code = template_code or config['kakao_aligo']['template_code']
     
     url = "https://kakaoapi.aligo.in/akv10/alimtalk/send/"
     
@@ -254,48 +357,31 @@ def send_kakao_aligo(phone, message, student_name, config):
     }
     
     try:
-        response = requests.post(url, data=data)
+        response = _http().post(url, data=data, timeout=HTTP_TIMEOUT)
         result = response.json()
         
-        if result.get('code') == '0':
-            return True
+        if str(result.get('code')) == '0':
+            return str((result.get('info') or {}).get('mid') or '') or True
         else:
-            print(f"알리고 카카오톡 전송 실패: {result}")
+            log('sms.provider_failed', "알리고 카카오톡 전송 실패", level='warning', response=result)
             return False
     except Exception as e:
-        print(f"알리고 카카오톡 전송 오류: {e}")
+        log('sms.provider_error', "알리고 카카오톡 전송 오류", level='error', error=str(e))
         return False
 
-def send_kakao_naver(phone, message, student_name, config):
+def send_kakao_naver(phone, message, student_name, config, template_code=None):
     """네이버 클라우드 플랫폼 카카오톡 알림톡 전송"""
     service_id = config['kakao_naver']['service_id']
     access_key = config['kakao_naver']['access_key']
     secret_key = config['kakao_naver']['secret_key']
     plus_friend_id = config['kakao_naver']['plus_friend_id']
-    template_code = config['kakao_naver']['template_code']
+    template_code = template_code or config['kakao_naver']['template_code']
     
     # API 요청 URL
     url = f"https://sens.apigw.ntruss.com/alimtalk/v2/services/{service_id}/messages"
     
-    # 타임스탬프
-    timestamp = str(int(time.time() * 1000))
-    
-    # 시그니처 생성
-    method = "POST"
-    uri = f"/alimtalk/v2/services/{service_id}/messages"
-    message_bytes = method + " " + uri + "\n" + timestamp + "\n" + access_key
-    message_bytes = bytes(message_bytes, 'UTF-8')
-    secret_key_bytes = bytes(secret_key, 'UTF-8')
-    
-    signing_key = base64.b64encode(hmac.new(secret_key_bytes, message_bytes, digestmod=hashlib.sha256).digest())
-    
-    # 헤더
-    headers = {
-        'Content-Type': 'application/json; charset=utf-8',
-        'x-ncp-apigw-timestamp': timestamp,
-        'x-ncp-iam-access-key': access_key,
-        'x-ncp-apigw-signature-v2': signing_key
-    }
+    # 헤더 (시그니처 포함)
+    headers = _ncp_headers("POST", f"/alimtalk/v2/services/{service_id}/messages", access_key, secret_key)
     
     # 요청 본문
     body = {
@@ -310,21 +396,22 @@ def send_kakao_naver(phone, message, student_name, config):
     }
     
     try:
-        response = requests.post(url, headers=headers, json=body)
+        response = _http().post(url, headers=headers, json=body, timeout=HTTP_TIMEOUT)
         if response.status_code == 202:
-            return True
+            return response.json().get('requestId') or True
         else:
-            print(f"네이버 카카오톡 전송 실패: {response.status_code}, {response.text}")
+            log('sms.provider_failed', "네이버 카카오톡 전송 실패", level='warning',
+                http_status=response.status_code, response=response.text[:500])
             return False
     except Exception as e:
-        print(f"네이버 카카오톡 전송 오류: {e}")
+        log('sms.provider_error', "네이버 카카오톡 전송 오류", level='error', error=str(e))
         return False
 
-def send_kakao_business(phone, message, student_name, config):
+def send_kakao_business(phone, message, student_name, config, template_code=None):
     """카카오 비즈니스 API 카카오톡 알림톡 전송"""
     rest_api_key = config['kakao_business']['rest_api_key']
     sender_key = config['kakao_business']['sender_key']
-    template_code = config['kakao_business']['template_code']
+    template_code = template_code or config['kakao_business']['template_code']
     
     url = "https://kapi.kakao.com/v1/api/talk/friends/message/default/send"
     
@@ -348,31 +435,459 @@ def send_kakao_business(phone, message, student_name, config):
     }
     
     try:
-        response = requests.post(url, headers=headers, data=data)
+        response = _http().post(url, headers=headers, data=data, timeout=HTTP_TIMEOUT)
         result = response.json()
         
         if result.get('result_code') == 0:
             return True
         else:
-            print(f"카카오 비즈니스 API 전송 실패: {result}")
+            log('sms.provider_failed', "카카오 비즈니스 API 전송 실패", level='warning', response=result)
             return False
     except Exception as e:
-        print(f"카카오 비즈니스 API 전송 오류: {e}")
+        log('sms.provider_error', "카카오 비즈니스 API 전송 오류", level='error', error=str(e))
         return False
 
-def send_sms(phone, message, student_name=""):
+def send_simulator(phone, message):
     """
-    SMS 또는 카카오톡 메시지 전송 메인 함수
+    로컬 시뮬레이터 전송 (네트워크 없음)
+    
+    요청 ID에 전송 시각과 결과를 담아 두어, 여러 워커에서 조회해도 같은 결과가 나온다.
+    번호가 0000으로 끝나면 수신 실패로 처리한다.
+    """
+    outcome = 'F' if phone.endswith('0000') else 'D'
+    return f"sim-{int(time.time() * 1000)}-{outcome}-{uuid.uuid4().hex[:8]}"
+
+# ===== 수신 결과 조회 =====
+# 각 함수는 전송 기록 목록을 받아 {기록 ID: (상태, 상세)} 를 돌려준다.
+# 상태가 None이면 아직 결과가 나오지 않은 것 (다음 주기에 다시 조회)
+
+# 시뮬레이터가 결과를 돌려주기까지 걸리는 시간(초)
+SIMULATOR_DELAY = 2
+
+def lookup_simulator(records, config):
+    """시뮬레이터 수신 결과 조회"""
+    results = {}
+    now_ms = int(time.time() * 1000)
+    for record in records:
+        try:
+            _, sent_ms, outcome, _ = record['request_id'].split('-')
+        except ValueError:
+            results[record['id']] = ('unknown', '잘못된 시뮬레이터 요청 ID')
+            continue
+        if now_ms - int(sent_ms) < SIMULATOR_DELAY * 1000:
+            results[record['id']] = (None, '')
+        elif outcome == 'F':
+            results[record['id']] = ('failed', '시뮬레이터: 수신 실패')
+        else:
+            results[record['id']] = ('delivered', '시뮬레이터: 수신 완료')
+    return results
+
+def _lookup_ncp(records, section, path, result_of):
+    """네이버 클라우드 플랫폼 requestId 기반 결과 조회 공통 처리"""
+    service_id = section['service_id']
+    results = {}
+    for record in records:
+        uri = f"/{path}/v2/services/{service_id}/messages?requestId={record['request_id']}"
+        headers = _ncp_headers("GET", uri, section['access_key'], section['secret_key'])
+        response = _http().get(f"https://sens.apigw.ntruss.com{uri}", headers=headers, timeout=HTTP_TIMEOUT)
+        if response.status_code != 200:
+            results[record['id']] = (None, f"조회 실패: {response.status_code}")
+            continue
+        messages = response.json().get('messages') or []
+        results[record['id']] = result_of(messages[0]) if messages else (None, '')
+    return results
+
+def lookup_sms_naver(records, config):
+    """네이버 SENS SMS 결과 조회"""
+    def result_of(msg):
+        if msg.get('status') != 'COMPLETED':
+            return (None, msg.get('status', ''))
+        if msg.get('statusName') == 'success':
+            return ('delivered', msg.get('statusMessage', ''))
+        return ('failed', msg.get('statusMessage', '') or msg.get('statusCode', ''))
+    return _lookup_ncp(records, config['naver'], 'sms', result_of)
+
+def lookup_kakao_naver(records, config):
+    """네이버 SENS 알림톡 결과 조회"""
+    def result_of(msg):
+        name = msg.get('messageStatusName')
+        if name == 'success':
+            return ('delivered', msg.get('messageStatusDesc', ''))
+        if name == 'fail':
+            return ('failed', msg.get('messageStatusDesc', '') or msg.get('messageStatusCode', ''))
+        return (None, name or '')
+    return _lookup_ncp(records, config['kakao_naver'], 'alimtalk', result_of)
+
+def lookup_sms_aligo(records, config):
+    """알리고 SMS 결과 조회 (sms_list)"""
+    results = {}
+    for record in records:
+        data = {
+            'key': config['aligo']['api_key'],
+            'user_id': config['aligo']['user_id'],
+            'mid': record['request_id']
+        }
+        result = _http().post("https://apis.aligo.in/sms_list/", data=data, timeout=HTTP_TIMEOUT).json()
+        items = result.get('list') or []
+        state = items[0].get('sms_state', '') if items else ''
+        if '완료' in state:
+            results[record['id']] = ('delivered', state)
+        elif '실패' in state:
+            results[record['id']] = ('failed', state)
+        else:
+            results[record['id']] = (None, state)
+    return results
+
+def lookup_kakao_aligo(records, config):
+    """알리고 알림톡 결과 조회 (history/detail)"""
+    results = {}
+    for record in records:
+        data = {
+            'apikey': config['kakao_aligo']['api_key'],
+            'userid': config['kakao_aligo']['user_id'],
+            'mid': record['request_id']
+        }
+        result = _http().post("https://kakaoapi.aligo.in/akv10/history/detail/", data=data, timeout=HTTP_TIMEOUT).json()
+        items = result.get('list') or []
+        item = items[0] if items else {}
+        rslt = str(item.get('rslt', ''))
+        if not item.get('rsltdate') or not rslt:
+            results[record['id']] = (None, '')
+        elif rslt == '0':
+            results[record['id']] = ('delivered', item.get('rslt_message', ''))
+        else:
+            results[record['id']] = ('failed', item.get('rslt_message', '') or rslt)
+    return results
+
+# 채널별 결과 조회 함수 (쿨SMS, 카카오 비즈니스 API는 조회를 지원하지 않아 'sent'로 기록)
+LOOKUP_FUNCTIONS = {
+    'simulator': lookup_simulator,
+    'naver': lookup_sms_naver,
+    'kakao_naver': lookup_kakao_naver,
+    'aligo': lookup_sms_aligo,
+    'kakao_aligo': lookup_kakao_aligo,
+}
+
+# ===== 전송 기록 DB =====
+
+_db_ready = set()
+
+# 최종 결과 캐시 (최근 조회한 기록만 보관)
+_result_cache = OrderedDict()
+_RESULT_CACHE_SIZE = 1000
+_result_cache_lock = threading.Lock()
+
+def _db():
+    """메시지 DB 연결 (스레드마다 새 연결, 처음 한 번 테이블 생성)"""
+    conn = sqlite3.connect(MESSAGE_DB_FILE, timeout=10)
+    conn.row_factory = sqlite3.Row
+    if MESSAGE_DB_FILE not in _db_ready:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id TEXT PRIMARY KEY,
+                channel TEXT NOT NULL,
+                request_id TEXT,
+                phone TEXT,
+                student_name TEXT,
+                content TEXT,
+                status TEXT NOT NULL,
+                detail TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                next_poll_at REAL,
+                poll_count INTEGER NOT NULL DEFAULT 0,
+                config_file TEXT,
+                template_code TEXT
+            )
+        """)
+        # 이전 버전 DB에는 config_file, template_code 컬럼이 없음
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(messages)")}
+        if 'config_file' not in columns:
+            conn.execute("ALTER TABLE messages ADD COLUMN config_file TEXT")
+        if 'template_code' not in columns:
+            conn.execute("ALTER TABLE messages ADD COLUMN template_code TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_poll ON messages (status, next_poll_at)")
+        conn.commit()
+        _db_ready.add(MESSAGE_DB_FILE)
+    return conn
+
+def record_message(channel, request_id, phone, student_name, content, status, detail='', config_file=None,
+                   next_poll_at=None, template_code=None):
+    """
+    전송 기록 저장, 기록 ID 반환 (config_file: 결과 조회에 쓸 지점 SMS 설정)
+    
+    next_poll_at: 'pending'은 다음 결과 조회 시각, 'queued'는 다른 워커가 가져갈 수 있는 시각
+    """
+    message_id = uuid.uuid4().hex
+    now = time.time()
+    if next_poll_at is None and status == 'pending':
+        next_poll_at = now + DELIVERY_POLL_INTERVAL
+    try:
+        conn = _db()
+        with conn:
+            conn.execute(
+                "INSERT INTO messages (id, channel, request_id, phone, student_name, content, status, detail,"
+                " created_at, updated_at, next_poll_at, config_file, template_code)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (message_id, channel, request_id, phone, student_name, content, status, detail,
+                 now, now, next_poll_at, config_file, template_code)
+            )
+        conn.close()
+    except sqlite3.Error as e:
+        log('message_db.error', "메시지 기록 저장 오류", level='error', error=str(e))
+    return message_id
+
+def update_message(message_id, channel, request_id, status, detail=''):
+    """대기열에서 전송을 마친 기록의 채널/요청 ID/상태 갱신"""
+    now = time.time()
+    next_poll_at = now + DELIVERY_POLL_INTERVAL if status == 'pending' else None
+    try:
+        conn = _db()
+        with conn:
+            conn.execute(
+                "UPDATE messages SET channel = ?, request_id = ?, status = ?, detail = ?,"
+                " updated_at = ?, next_poll_at = ? WHERE id = ?",
+                (channel, request_id, status, detail, now, next_poll_at, message_id)
+            )
+        conn.close()
+    except sqlite3.Error as e:
+        log('message_db.error', "메시지 기록 갱신 오류", level='error', error=str(e), message_id=message_id)
+
+def _row_to_dict(row):
+    return {
+        'id': row['id'],
+        'channel': row['channel'],
+        'request_id': row['request_id'],
+        'phone': row['phone'],
+        'student_name': row['student_name'],
+        'content': row['content'],
+        'status': row['status'],
+        'detail': row['detail'],
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at'],
+        'poll_count': row['poll_count'],
+        'config_file': row['config_file']
+    }
+
+def get_message(message_id):
+    """
+    전송 기록 조회 (최종 결과는 메모리 캐시 사용)
+    
+    Returns:
+        dict 또는 None
+    """
+    with _result_cache_lock:
+        cached = _result_cache.get(message_id)
+        if cached is not None:
+            _result_cache.move_to_end(message_id)
+            return cached
+    
+    conn = _db()
+    row = conn.execute("SELECT * FROM messages WHERE id = ?", (message_id,)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    
+    record = _row_to_dict(row)
+    if record['status'] in FINAL_STATUSES:
+        with _result_cache_lock:
+            _result_cache[message_id] = record
+            if len(_result_cache) > _RESULT_CACHE_SIZE:
+                _result_cache.popitem(last=False)
+    return record
+
+def poll_delivery_results(message_ids=None):
+    """
+    결과가 나오지 않은 전송 기록을 채널별로 묶어 한 번에 조회하고 저장
+    
+    여러 워커가 동시에 폴링해도 같은 기록을 중복 조회하지 않도록
+    next_poll_at 을 먼저 갱신(선점)한 기록만 조회한다.
     
     Args:
-        phone: 수신자 전화번호
-        message: 전송할 메시지
-        student_name: 학생 이름 (카카오톡 템플릿용)
+        message_ids: 특정 기록만 즉시 조회할 때 지정
         
     Returns:
-        bool: 전송 성공 여부
+        int: 최종 결과가 확정된 건수
+    """
+    now = time.time()
+    conn = _db()
+    
+    # 워커 재시작 등으로 대기열에서 사라진 기록은 다시 보내고, 전송 중 중단된 기록은 정리
+    if not message_ids:
+        with conn:
+            conn.execute(
+                "UPDATE messages SET status = 'unknown', detail = '발송 대기 중 중단', updated_at = ?"
+                " WHERE status = 'queued' AND created_at < ?",
+                (now, now - QUEUED_MAX_AGE)
+            )
+            conn.execute(
+                "UPDATE messages SET status = 'unknown', detail = '전송 중 중단', updated_at = ?"
+                " WHERE status = 'sending' AND updated_at < ?",
+                (now, now - SENDING_STALE_SECONDS)
+            )
+        recover_queued_messages()
+    
+    if message_ids:
+        placeholders = ','.join('?' * len(message_ids))
+        rows = conn.execute(
+            f"SELECT * FROM messages WHERE status = 'pending' AND id IN ({placeholders})",
+            list(message_ids)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT * FROM messages WHERE status = 'pending' AND next_poll_at <= ?"
+            " ORDER BY next_poll_at LIMIT ?",
+            (now, DELIVERY_POLL_BATCH)
+        ).fetchall()
+    
+    # 선점: 다음 조회 시각을 뒤로 미룸 (조회 횟수에 따라 간격을 늘림)
+    claimed = []
+    with conn:
+        for row in rows:
+            delay = DELIVERY_POLL_INTERVAL * min(2 ** row['poll_count'], 32)
+            updated = conn.execute(
+                "UPDATE messages SET next_poll_at = ?, poll_count = poll_count + 1"
+                " WHERE id = ? AND status = 'pending' AND next_poll_at = ?",
+                (now + delay, row['id'], row['next_poll_at'])
+            ).rowcount
+            if updated:
+                claimed.append(_row_to_dict(row))
+    
+    # 채널과 SMS 설정(지점)별로 묶어서 조회
+    groups = {}
+    for record in claimed:
+        groups.setdefault((record['channel'], record['config_file']), []).append(record)
+    
+    results = {}
+    for (channel, config_file), records in groups.items():
+        lookup = LOOKUP_FUNCTIONS.get(channel)
+        if lookup is None:
+            results.update({r['id']: ('sent', '결과 조회 미지원') for r in records})
+            continue
+        config = load_sms_config(config_file)
+        if config is None:
+            results.update({r['id']: ('unknown', '지점 SMS 설정 없음') for r in records})
+            continue
+        try:
+            results.update(lookup(records, config))
+        except Exception as e:
+            log('delivery.lookup_error', "결과 조회 오류", level='error', channel=channel, error=str(e))
+    
+    finished = 0
+    with conn:
+        for record in claimed:
+            status, detail = results.get(record['id'], (None, ''))
+            if status is None and now - record['created_at'] > DELIVERY_MAX_AGE:
+                status, detail = 'unknown', '결과 조회 시간 초과'
+            if status is None:
+                continue
+            conn.execute(
+                "UPDATE messages SET status = ?, detail = ?, updated_at = ?, next_poll_at = NULL WHERE id = ?",
+                (status, detail, now, record['id'])
+            )
+            finished += 1
+    conn.close()
+    return finished
+
+# ===== 백그라운드 폴러 =====
+
+_poller = {'thread': None, 'pid': None}
+_poller_lock = threading.Lock()
+
+def _poll_loop():
+    """결과 조회 반복 (데몬 스레드)"""
+    while True:
+        time.sleep(DELIVERY_POLL_INTERVAL)
+        try:
+            poll_delivery_results()
+        except Exception as e:
+            log('delivery.poll_error', "수신 결과 폴링 오류", level='error', error=str(e))
+
+def start_delivery_poller():
     """
-    config = load_sms_config()
+    백그라운드 결과 폴러 시작 (프로세스당 1개)
+    
+    gunicorn --preload 로 fork된 워커에는 마스터의 스레드가 없으므로
+    pid가 바뀌었으면 새로 띄운다.
+    """
+    with _poller_lock:
+        thread = _poller['thread']
+        if thread is not None and thread.is_alive() and _poller['pid'] == os.getpid():
+            return
+        thread = threading.Thread(target=_poll_loop, name='delivery-poller', daemon=True)
+        thread.start()
+        _poller['thread'] = thread
+        _poller['pid'] = os.getpid()
+
+def _audit_send(message_id, student_name, phone, channel, status, started, config_file,
+                request_id=None, enqueued_at=None, detail=None, msg_type=None):
+    """알림 한 건의 감사 기록 (학생, 프로바이더, 소요 시간, 결과)"""
+    entry = {
+        'message_id': message_id,
+        'student_name': student_name,
+        'phone': mask_phone(phone),
+        'channel': channel,
+        'status': status,
+        'request_id': request_id,
+        'latency_ms': round((time.time() - started) * 1000, 1),
+        'config_file': config_file
+    }
+    if enqueued_at:
+        entry['queued_ms'] = round((started - enqueued_at) * 1000, 1)
+    if msg_type:
+        entry['msg_type'] = msg_type
+    if detail:
+        entry['detail'] = detail
+    audit(**entry)
+
+def _reject_invalid_phone(phone, message, student_name, config_file, message_id=None, started=None,
+                          enqueued_at=None):
+    """올바르지 않은 번호: 전송하지 않고 실패로 기록"""
+    log('sms.invalid_phone', "올바르지 않은 전화번호", level='warning',
+        phone=mask_phone(phone), student_name=student_name)
+    if message_id:
+        update_message(message_id, 'invalid', None, 'failed', 'invalid_phone')
+    else:
+        message_id = record_message('invalid', None, phone, student_name, message, 'failed',
+                                    'invalid_phone', config_file)
+    _audit_send(message_id, student_name, phone, 'invalid', 'failed', started or time.time(), config_file,
+                enqueued_at=enqueued_at, detail='invalid_phone')
+    return False
+
+def _reject_missing_config(phone, message, student_name, config_file, message_id=None, started=None,
+                           enqueued_at=None):
+    """지점 SMS 설정 파일 없음: 전송하지 않고 실패로 기록"""
+    log('sms.no_branch_config', "지점 SMS 설정 파일이 없어 전송하지 않음", level='error',
+        config_file=config_file, student_name=student_name)
+    if message_id:
+        update_message(message_id, 'none', None, 'failed', 'no_sms_config')
+    else:
+        message_id = record_message('none', None, phone, student_name, message, 'failed',
+                                    'no_sms_config', config_file)
+    _audit_send(message_id, student_name, phone, 'none', 'failed', started or time.time(), config_file,
+                enqueued_at=enqueued_at, detail='no_sms_config')
+    return False
+
+def _deliver(phone, message, student_name, config_file, message_id=None, enqueued_at=None,
+             msg_type=None, template_code=None):
+    """
+    프로바이더로 실제 전송하고 결과 기록
+    
+    message_id가 있으면 (대기열에서 꺼낸 경우) 새로 기록하지 않고 기존 기록을 갱신한다.
+    msg_type(SMS/LMS)은 보통 템플릿 렌더링 때 정해져 오고, 없으면 여기서 길이로 정한다.
+    """
+    started = time.time()
+    
+    # 명단에서 이미 정규화된 번호는 그대로 통과, 올바르지 않은 번호는 프로바이더 호출 전에 거절
+    normalized = normalize_phone(phone)
+    if normalized is None:
+        return _reject_invalid_phone(phone, message, student_name, config_file, message_id, started, enqueued_at)
+    phone = normalized
+    
+    config = load_sms_config(config_file)
+    if config is None:
+        return _reject_missing_config(phone, message, student_name, config_file, message_id, started, enqueued_at)
+    msg_type = msg_type or message_type_for(message)
     
     # 메시지 타입 확인
     message_type = config.get('message_type', 'sms')
@@ -380,40 +895,267 @@ def send_sms(phone, message, student_name=""):
     # 테스트 모드인 경우 실제 전송하지 않음
     if config.get('test_mode', True):
         type_text = "카카오톡" if message_type == "kakao" else "SMS"
-        print(f"  [테스트 모드] {type_text} 전송 시뮬레이션")
-        print(f"  수신: {phone}")
-        print(f"  내용: {message}")
-        return True
-    
-    # 전화번호 포맷팅 (하이픈 제거)
-    phone = phone.replace('-', '').replace(' ', '')
+        # 내용은 메시지 DB에만 남기고 로그에는 길이만
+        log('sms.test_mode', f"[테스트 모드] {type_text} 전송 시뮬레이션",
+            phone=mask_phone(phone), length=len(message))
+        if message_id:
+            update_message(message_id, 'test', None, 'test')
+        else:
+            message_id = record_message('test', None, phone, student_name, message, 'test',
+                                        config_file=config_file)
+        _audit_send(message_id, student_name, phone, 'test', 'test', started, config_file,
+                    enqueued_at=enqueued_at, msg_type=msg_type)
+        return message_id
     
     # 선택된 프로바이더로 전송
     provider = config.get('provider', 'naver')
     
+    # 로컬 시뮬레이터
+    if provider == 'simulator':
+        channel = 'simulator'
+        result = send_simulator(phone, message)
+    
     # 카카오톡 전송
-    if message_type == 'kakao':
+    elif message_type == 'kakao':
         if provider == 'kakao_aligo' or provider == 'aligo':
-            return send_kakao_aligo(phone, message, student_name, config)
+            channel = 'kakao_aligo'
+            result = send_kakao_aligo(phone, message, student_name, config, template_code)
         elif provider == 'kakao_naver' or provider == 'naver':
-            return send_kakao_naver(phone, message, student_name, config)
+            channel = 'kakao_naver'
+            result = send_kakao_naver(phone, message, student_name, config, template_code)
         elif provider == 'kakao_business':
-            return send_kakao_business(phone, message, student_name, config)
+            channel = 'kakao_business'
+            result = send_kakao_business(phone, message, student_name, config, template_code)
         else:
-            print(f"알 수 없는 카카오톡 프로바이더: {provider}")
+            log('sms.unknown_provider', "알 수 없는 카카오톡 프로바이더", level='error', provider=provider)
+            if message_id:
+                update_message(message_id, 'unknown_provider', None, 'failed', provider)
+            _audit_send(message_id, student_name, phone, provider, 'failed', started, config_file,
+                        enqueued_at=enqueued_at, detail='unknown_provider', msg_type=msg_type)
             return False
     
     # SMS 전송
     else:
         if provider == 'naver':
-            return send_sms_naver(phone, message, config)
+            channel = 'naver'
+            result = send_sms_naver(phone, message, config, msg_type)
         elif provider == 'coolsms':
-            return send_sms_coolsms(phone, message, config)
+            channel = 'coolsms'
+            result = send_sms_coolsms(phone, message, config, msg_type)
         elif provider == 'aligo':
-            return send_sms_aligo(phone, message, config)
+            channel = 'aligo'
+            result = send_sms_aligo(phone, message, config, msg_type)
         else:
-            print(f"알 수 없는 SMS 프로바이더: {provider}")
+            log('sms.unknown_provider', "알 수 없는 SMS 프로바이더", level='error', provider=provider)
+            if message_id:
+                update_message(message_id, 'unknown_provider', None, 'failed', provider)
+            _audit_send(message_id, student_name, phone, provider, 'failed', started, config_file,
+                        enqueued_at=enqueued_at, detail='unknown_provider', msg_type=msg_type)
             return False
+    
+    # 전송 기록 (요청 ID가 있고 조회를 지원하면 결과 대기)
+    request_id = result if isinstance(result, str) else None
+    if not result:
+        status = 'failed'
+    elif request_id and channel in LOOKUP_FUNCTIONS:
+        status = 'pending'
+    else:
+        status = 'sent'
+    
+    if message_id:
+        update_message(message_id, channel, request_id, status)
+    else:
+        message_id = record_message(channel, request_id, phone, student_name, message, status,
+                                    config_file=config_file)
+    _audit_send(message_id, student_name, phone, channel, status, started, config_file,
+                request_id=request_id, enqueued_at=enqueued_at, msg_type=msg_type)
+    if status == 'pending':
+        start_delivery_poller()
+    
+    return message_id if result else False
+
+# ===== 발송 대기열 =====
+# 등원/하원 요청이 프로바이더 응답(최대 HTTP_TIMEOUT초)을 기다리지 않도록
+# 기록만 남기고 즉시 반환, 실제 전송은 백그라운드 스레드가 맡는다.
+
+_outbound = {'queue': None, 'pid': None}
+_outbound_lock = threading.Lock()
+
+def _outbound_loop(outbound):
+    """대기열 전송 반복 (데몬 스레드)"""
+    while True:
+        message_id, phone, message, student_name, config_file, enqueued_at, msg_type, template_code = outbound.get()
+        try:
+            # 다른 워커가 (재시작 후 되살린 기록을) 이미 보내는 중이면 건너뜀
+            if not _claim_for_sending(message_id):
+                continue
+            _deliver(phone, message, student_name, config_file, message_id, enqueued_at, msg_type, template_code)
+        except Exception as e:
+            log('sms.outbound_error', "메시지 전송 오류", level='error', message_id=message_id, error=str(e))
+            update_message(message_id, 'error', None, 'failed', str(e))
+            _audit_send(message_id, student_name, phone, 'error', 'failed', enqueued_at, config_file,
+                        detail=str(e))
+        finally:
+            outbound.task_done()
+
+def _claim_for_sending(message_id):
+    """'queued' → 'sending' 선점 (한 워커만 성공, DB 오류면 그대로 전송)"""
+    try:
+        conn = _db()
+        with conn:
+            claimed = conn.execute(
+                "UPDATE messages SET status = 'sending', updated_at = ?, next_poll_at = NULL"
+                " WHERE id = ? AND status = 'queued'",
+                (time.time(), message_id)
+            ).rowcount
+        conn.close()
+        return claimed == 1
+    except sqlite3.Error as e:
+        log('message_db.error', "전송 선점 오류", level='error', error=str(e), message_id=message_id)
+        return True
+
+def recover_queued_messages():
+    """
+    맡은 워커가 사라진 'queued' 기록을 이 워커의 발송 대기열로 가져옴
+    
+    next_poll_at(가져갈 수 있는 시각)이 지난 기록을 결과 조회와 같은 방식으로 선점한다.
+    원래 워커가 살아 있어 두 대기열에 같은 기록이 있더라도 _claim_for_sending 으로 한 번만 보낸다.
+    
+    Returns:
+        int: 가져온 건수
+    """
+    now = time.time()
+    conn = _db()
+    rows = conn.execute(
+        "SELECT * FROM messages WHERE status = 'queued' AND COALESCE(next_poll_at, created_at + ?) <= ?"
+        " ORDER BY created_at LIMIT ?",
+        (QUEUED_LEASE_SECONDS, now, DELIVERY_POLL_BATCH)
+    ).fetchall()
+    
+    recovered = []
+    with conn:
+        for row in rows:
+            updated = conn.execute(
+                "UPDATE messages SET next_poll_at = ? WHERE id = ? AND status = 'queued'"
+                " AND next_poll_at IS ?",
+                (now + QUEUED_LEASE_SECONDS, row['id'], row['next_poll_at'])
+            ).rowcount
+            if updated:
+                recovered.append(row)
+    conn.close()
+    
+    if recovered:
+        outbound = _outbound_queue()
+        for row in recovered:
+            log('sms.recovered', "중단된 발송 대기 메시지 재전송", message_id=row['id'])
+            outbound.put((row['id'], row['phone'], row['content'], row['student_name'], row['config_file'],
+                          row['created_at'], None, row['template_code']))
+    return len(recovered)
+
+def _outbound_queue():
+    """
+    발송 대기열 (프로세스당 1개, 처음 쓸 때 전송 스레드 시작)
+    
+    폴러와 마찬가지로 fork된 워커에서는 pid를 보고 새로 만든다.
+    """
+    with _outbound_lock:
+        if _outbound['pid'] != os.getpid():
+            outbound = queue.Queue()
+            for i in range(OUTBOUND_WORKERS):
+                thread = threading.Thread(target=_outbound_loop, args=(outbound,),
+                                          name=f'sms-outbound-{i}', daemon=True)
+                thread.start()
+            _outbound['queue'] = outbound
+            _outbound['pid'] = os.getpid()
+        return _outbound['queue']
+
+# 지연 전송 대기 {기록 ID: 대기열 항목} (형제 알림을 묶는 동안 보관)
+_delayed = {}
+_delayed_lock = threading.Lock()
+
+def enqueue_sms(phone, message, student_name="", config_file=None, delay=0, msg_type=None, template_code=None):
+    """
+    메시지 전송 예약 (즉시 반환)
+    
+    'queued' 상태로 기록한 뒤 백그라운드에서 전송하고, 전송이 끝나면
+    같은 기록의 상태가 send_sms와 동일하게 갱신된다.
+    
+    Args:
+        delay: 이 시간(초) 뒤에 전송 (그 사이 amend_queued_sms 로 내용을 바꿀 수 있음)
+        msg_type, template_code: 렌더링한 템플릿의 SMS/LMS 구분과 알림톡 템플릿 코드
+    
+    Returns:
+        str 또는 False: 전송 기록 ID (get_message로 조회), 번호가 올바르지 않으면 False
+    """
+    normalized = normalize_phone(phone)
+    if normalized is None:
+        return _reject_invalid_phone(phone, message, student_name, config_file)
+    
+    message_id = record_message('queued', None, normalized, student_name, message, 'queued',
+                                config_file=config_file,
+                                next_poll_at=time.time() + delay + QUEUED_LEASE_SECONDS,
+                                template_code=template_code)
+    item = [message_id, normalized, message, student_name, config_file, time.time(), msg_type, template_code]
+    if delay > 0:
+        with _delayed_lock:
+            _delayed[message_id] = item
+        timer = threading.Timer(delay, _release_delayed, args=(message_id,))
+        timer.daemon = True
+        timer.start()
+    else:
+        _outbound_queue().put(tuple(item))
+    return message_id
+
+def _release_delayed(message_id):
+    """지연 시간이 지난 메시지를 전송 대기열로"""
+    with _delayed_lock:
+        item = _delayed.pop(message_id, None)
+    if item is not None:
+        _outbound_queue().put(tuple(item))
+
+def amend_queued_sms(message_id, message, student_name, msg_type=None):
+    """
+    지연 전송 대기 중인 메시지 내용 변경 (msg_type: 바뀐 길이에 맞는 SMS/LMS)
+    
+    Returns:
+        bool: 이미 전송 대기열로 넘어갔으면 False (새로 보내야 함)
+    """
+    with _delayed_lock:
+        item = _delayed.get(message_id)
+        if item is None:
+            return False
+        item[2] = message
+        item[3] = student_name
+        item[6] = msg_type
+    try:
+        conn = _db()
+        with conn:
+            conn.execute("UPDATE messages SET content = ?, student_name = ?, updated_at = ? WHERE id = ?",
+                         (message, student_name, time.time(), message_id))
+        conn.close()
+    except sqlite3.Error as e:
+        log('message_db.error', "메시지 기록 갱신 오류", level='error', error=str(e), message_id=message_id)
+    return True
+
+def send_sms(phone, message, student_name="", config_file=None, msg_type=None, template_code=None):
+    """
+    SMS 또는 카카오톡 메시지 전송 메인 함수 (전송이 끝날 때까지 대기)
+    
+    전송 결과는 프로바이더 요청 ID와 함께 메시지 DB에 기록되며,
+    결과 조회를 지원하는 프로바이더는 백그라운드에서 수신 여부를 확인한다.
+    
+    Args:
+        phone: 수신자 전화번호
+        message: 전송할 메시지
+        student_name: 학생 이름 (카카오톡 템플릿용)
+        config_file: 지점별 SMS 설정 파일 (없으면 기본 설정)
+        msg_type: 'SMS' 또는 'LMS' (없으면 EUC-KR 바이트 길이로 결정)
+        template_code: 알림톡 템플릿 코드 (없으면 프로바이더 설정의 기본 코드)
+        
+    Returns:
+        str 또는 False: 성공 시 전송 기록 ID (get_message로 조회), 실패 시 False
+    """
+    return _deliver(phone, message, student_name, config_file, msg_type=msg_type, template_code=template_code)
 
 # 테스트
 if __name__ == "__main__":
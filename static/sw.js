@@ -0,0 +1,50 @@
+// 학원 등원/하원 모바일 서비스 워커
+// 모바일 페이지(/mobile)를 캐시해 두고 바로 보여준 뒤 백그라운드에서 갱신한다.
+// 학생 목록과 오프라인 작업 대기열은 페이지에서 IndexedDB로 관리한다.
+
+const CACHE_NAME = 'academy-shell-v1';
+const SHELL_URLS = ['/mobile'];
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(
+        caches.open(CACHE_NAME).then((cache) => cache.addAll(SHELL_URLS))
+    );
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil(
+        caches.keys()
+            .then((keys) => Promise.all(
+                keys.filter((key) => key !== CACHE_NAME).map((key) => caches.delete(key))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET' || request.mode !== 'navigate') return;
+
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin || !url.pathname.endsWith('/mobile')) return;
+
+    // stale-while-revalidate: 캐시가 있으면 즉시 응답하고 네트워크로 갱신
+    event.respondWith(
+        caches.open(CACHE_NAME).then(async (cache) => {
+            const cached = await cache.match(request, { ignoreSearch: true });
+            const network = fetch(request).then((response) => {
+                if (response.ok) {
+                    cache.put(request, response.clone());
+                }
+                return response;
+            });
+
+            if (cached) {
+                event.waitUntil(network.catch(() => {}));
+                return cached;
+            }
+            return network;
+        })
+    );
+});
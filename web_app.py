@@ -4,26 +4,250 @@
 PC, 모바일, 태블릿에서 모두 사용 가능
 """
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for
-import openpyxl
 import os
+import re
+import secrets
+import sys
 import json
+import time
+import sqlite3
+import zlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from sms_sender import send_sms
+
+try:
+    import fcntl
+except ImportError:  # Windows: 워커 간 파일 잠금 없이 프로세스 내 잠금만 사용
+    fcntl = None
+
+# 모듈 로드 시간 측정 (콜드 스타트 보고용)
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, send_file, g, abort, has_request_context
+from sms_sender import enqueue_sms, amend_queued_sms, get_message, poll_delivery_results, start_delivery_poller
+from qr_checkin import verify_token, generate_qr_png, pregenerate_qr_codes
+from event_log import log, recent_audit
+from phone_numbers import normalize_phone
+from message_templates import TemplateRegistry, plain_message, LMS_MAX_BYTES
+
+# openpyxl은 무거우므로 실제로 엑셀을 다룰 때 함수 안에서 import 한다.
+# (gunicorn --preload 사용 시 create_app()에서 마스터 프로세스가 한 번만 로드)
 
 app = Flask(__name__)
 app.config['JSON_AS_ASCII'] = False
 
-# 설정 파일 경로
+# 설정 파일 경로 (기본 지점)
 EXCEL_FILE = os.getenv('EXCEL_FILE', '202511_자동알림.xlsx')
 CONFIG_FILE = os.getenv('CONFIG_FILE', 'config.json')
 SMS_CONFIG_FILE = os.getenv('SMS_CONFIG_FILE', 'sms_config.json')
 
-def init_excel_file():
+# 지점별 폴더: branches/<지점>/roster.xlsx, config.json, sms_config.json
+# /b/<지점>/... 경로로 접속하면 해당 지점 파일을 사용한다.
+BRANCH_DIR = os.getenv('BRANCH_DIR', 'branches')
+
+# 메모리에 올려 둘 최대 지점 수, 이 시간(초) 동안 안 쓰인 지점은 캐시에서 내림
+MAX_LOADED_BRANCHES = int(os.getenv('MAX_LOADED_BRANCHES', '32'))
+BRANCH_IDLE_SECONDS = int(os.getenv('BRANCH_IDLE_SECONDS', '1800'))
+
+_BRANCH_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def _empty_roster_cache():
+    return {'key': None, 'students': [], 'by_row': {}, 'by_name': {}, 'by_phone': {}, 'by_id': {},
+            'json': None, 'etag': None}
+
+class Branch:
+    """
+    지점 하나의 파일 경로와 캐시
+    
+    설정/학생 목록 캐시는 파일이 바뀔 때만 다시 읽는다.
+    학생 목록 캐시는 행 번호/이름 색인과 /api/students 응답(JSON 바이트, ETag)을 함께 보관한다.
+    
+    캐시는 항목을 하나씩 고치지 않고 dict 전체를 새로 만들어 바꿔 끼우므로
+    여러 스레드/그린렛이 동시에 읽어도 반쯤 갱신된 상태를 보지 않는다.
+    """
+    
+    def __init__(self, branch_id, excel_file, config_file, sms_config_file):
+        self.id = branch_id
+        self.excel_file = excel_file
+        self.config_file = config_file
+        self.sms_config_file = sms_config_file
+        self.config_cache = {'key': None, 'config': None, 'templates': None}
+        self.roster_cache = _empty_roster_cache()
+        self.initialized = False
+        self.last_used = time.time()
+        # 학생 목록 다시 읽기 / 엑셀 쓰기 잠금
+        self.load_lock = threading.Lock()
+        self.write_lock = threading.RLock()
+    
+    @property
+    def base_path(self):
+        """URL 접두사 (기본 지점은 빈 문자열)"""
+        return f"/b/{self.id}" if self.id else ''
+
+# 기본 지점 (기존 단일 학원 설정, 환경 변수 EXCEL_FILE/CONFIG_FILE 사용)
+DEFAULT_BRANCH = Branch('', EXCEL_FILE, CONFIG_FILE, None)
+
+# 불러온 지점 (가장 오래 안 쓰인 지점이 앞쪽)
+_branches = OrderedDict()
+_branches_lock = threading.Lock()
+
+def get_branch(branch_id):
+    """
+    지점 찾기 (처음 접근할 때 불러오고, 오래 안 쓰인 지점은 내림)
+    
+    Returns:
+        Branch 또는 None: 지점 폴더가 없으면 None
+    """
+    if not branch_id:
+        return DEFAULT_BRANCH
+    
+    if not _BRANCH_ID_PATTERN.match(branch_id):
+        return None
+    
+    now = time.time()
+    with _branches_lock:
+        branch = _branches.get(branch_id)
+        if branch is None:
+            directory = os.path.join(BRANCH_DIR, branch_id)
+            if not os.path.isdir(directory):
+                return None
+            branch = Branch(branch_id,
+                            os.path.join(directory, 'roster.xlsx'),
+                            os.path.join(directory, 'config.json'),
+                            os.path.join(directory, 'sms_config.json'))
+            _branches[branch_id] = branch
+        
+        _branches.move_to_end(branch_id)
+        branch.last_used = now
+        
+        # 오래된 것부터 확인: 개수 초과 또는 유휴 시간 초과면 내림
+        while _branches:
+            oldest_id, oldest = next(iter(_branches.items()))
+            if oldest is branch:
+                break
+            if len(_branches) > MAX_LOADED_BRANCHES or now - oldest.last_used > BRANCH_IDLE_SECONDS:
+                del _branches[oldest_id]
+            else:
+                break
+    
+    return branch
+
+def current_branch():
+    """현재 요청의 지점 (요청 밖에서는 기본 지점)"""
+    if has_request_context():
+        return g.get('branch') or DEFAULT_BRANCH
+    return DEFAULT_BRANCH
+
+@app.url_value_preprocessor
+def _select_branch(endpoint, values):
+    """/b/<branch>/... 경로의 지점을 골라 g.branch 에 저장"""
+    branch_id = values.pop('branch', None) if values else None
+    branch = get_branch(branch_id)
+    if branch is None:
+        abort(404)
+    if not branch.initialized:
+        with branch.write_lock:
+            if not branch.initialized:
+                init_excel_file(branch)
+                branch.initialized = True
+    g.branch = branch
+
+def route(rule, **options):
+    """기본 경로(rule)와 지점 경로(/b/<branch>rule)에 같은 뷰를 등록"""
+    def decorator(view):
+        app.add_url_rule(rule, view.__name__, view, **options)
+        app.add_url_rule(f"/b/<branch>{rule}", f"branch_{view.__name__}", view, **options)
+        return view
+    return decorator
+
+# 납입 상태 문자열 (학생마다 새로 만들지 않고 공유)
+PAYMENT_PAID = sys.intern('납입완료')
+PAYMENT_UNPAID = sys.intern('미납')
+
+class Student:
+    """
+    학생 한 명 (학생 수가 많아도 메모리를 적게 쓰도록 __slots__ 사용)
+    
+    phone은 유효하면 정규 형식(숫자만), 아니면 셀에 적힌 그대로 두어 화면에서 고칠 수 있게 한다.
+    student_id는 설정에 id_column 이 있을 때 QR 코드에 쓰는 학생 ID (없으면 None)
+    """
+    
+    __slots__ = ('row', 'name', 'phone', 'phone_valid', 'status', 'payment_date', 'student_id')
+    
+    def __init__(self, row, name, phone, status, payment_date, phone_valid=False, student_id=None):
+        self.row = row
+        self.name = name
+        self.phone = phone
+        self.phone_valid = phone_valid
+        self.status = status
+        self.payment_date = payment_date
+        self.student_id = student_id
+    
+    @property
+    def qr_subject(self):
+        """QR 토큰에 서명하는 값 (학생 ID, 없으면 이름)"""
+        return self.student_id or self.name
+    
+    @property
+    def payment_status(self):
+        return PAYMENT_PAID if self.payment_date else PAYMENT_UNPAID
+    
+    def to_dict(self):
+        return {
+            'row': self.row,
+            'name': self.name,
+            'phone': self.phone,
+            'phone_valid': self.phone_valid,
+            'status': self.status,
+            'payment_date': self.payment_date,
+            'payment_status': self.payment_status
+        }
+
+# 첫 요청 처리 시간 측정용 (보고한 프로세스 pid, fork된 워커마다 1회)
+_startup = {'first_request_pid': None}
+
+def _file_key(path):
+    """파일 변경 감지용 키 (수정 시각, 크기). 파일이 없으면 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def invalidate_roster_cache(branch=None):
+    """학생 목록 캐시 무효화 (엑셀 저장 직후 호출)"""
+    (branch or current_branch()).roster_cache = _empty_roster_cache()
+
+@contextmanager
+def workbook_lock(branch=None):
+    """
+    엑셀 읽기-수정-저장 구간 잠금
+    
+    같은 프로세스의 스레드/그린렛은 지점별 락으로, 다른 gunicorn 워커는
+    <엑셀 파일>.lock 파일 잠금으로 막아 동시 저장으로 변경이 사라지지 않게 한다.
+    """
+    branch = branch or current_branch()
+    with branch.write_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(branch.excel_file + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def init_excel_file(branch=None):
     """Excel 파일이 없으면 생성"""
-    if not os.path.exists(EXCEL_FILE):
-        print(f"Excel 파일이 없습니다. 새로 생성합니다: {EXCEL_FILE}")
+    branch = branch or current_branch()
+    excel_file = branch.excel_file
+    if not os.path.exists(excel_file):
+        log('excel.create', "Excel 파일이 없습니다. 새로 생성합니다", excel_file=excel_file)
         try:
+            import openpyxl
             wb = openpyxl.Workbook()
             ws = wb.active
             
@@ -39,28 +263,71 @@ def init_excel_file():
             ws['C2'] = 0
             ws['D2'] = ''
             
-            wb.save(EXCEL_FILE)
-            print(f"Excel 파일 생성 완료: {EXCEL_FILE}")
+            wb.save(excel_file)
+            log('excel.created', "Excel 파일 생성 완료", excel_file=excel_file)
         except Exception as e:
-            print(f"Excel 파일 생성 실패 (읽기 전용 파일 시스템일 수 있음): {e}")
-            print("메모리 기반 모드로 전환합니다.")
+            log('excel.create_failed', "Excel 파일 생성 실패 (읽기 전용 파일 시스템일 수 있음), 메모리 기반 모드로 전환합니다.",
+                level='error', excel_file=excel_file, error=str(e))
+
+def save_workbook(wb, branch=None):
+    """
+    엑셀 저장 (임시 파일에 쓴 뒤 교체)
+    
+    다른 워커가 읽는 도중에 반쯤 쓰인 파일을 보지 않도록 os.replace로 한 번에 바꾼다.
+    workbook_lock() 안에서 호출해야 한다.
+    """
+    excel_file = (branch or current_branch()).excel_file
+    tmp_file = f"{excel_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        wb.save(tmp_file)
+        os.replace(tmp_file, excel_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
 
-def load_config():
-    """설정 파일 로드 (환경 변수 우선)"""
+def _uses_env_config(branch):
+    """환경 변수 설정은 기본 지점에만 적용"""
+    return branch is DEFAULT_BRANCH and bool(os.getenv('ACADEMY_NAME'))
+
+def load_config(branch=None):
+    """설정 파일 로드 (환경 변수 우선, 파일이 바뀔 때만 다시 읽음)"""
+    branch = branch or current_branch()
+    config_cache = branch.config_cache
+    if _uses_env_config(branch):
+        key = ('env', os.getenv('ACADEMY_NAME'))
+    else:
+        key = ('file', _file_key(branch.config_file))
+    if config_cache['config'] is not None and config_cache['key'] == key:
+        return config_cache['config']
+    
+    config = _read_config(branch)
+    # 알림 문구 템플릿도 설정이 바뀔 때만 한 번 컴파일
+    branch.config_cache = {'key': key, 'config': config, 'templates': TemplateRegistry(config)}
+    return config
+
+def load_templates(branch=None):
+    """현재 설정의 컴파일된 알림 문구 템플릿"""
+    branch = branch or current_branch()
+    load_config(branch)
+    return branch.config_cache['templates']
+
+def _read_config(branch):
+    """설정 파일 실제 로드"""
     # 환경 변수에서 먼저 읽기 (Render, Railway 등 호스팅 서비스용)
-    if os.getenv('ACADEMY_NAME'):
+    if _uses_env_config(branch):
         return {
             "academy_name": os.getenv('ACADEMY_NAME', 'OO학원'),
             "name_column": os.getenv('NAME_COLUMN', 'A'),
             "phone_column": os.getenv('PHONE_COLUMN', 'B'),
             "status_column": os.getenv('STATUS_COLUMN', 'C'),
             "payment_column": os.getenv('PAYMENT_COLUMN', 'D'),
+            "id_column": os.getenv('ID_COLUMN') or None,
             "start_row": int(os.getenv('START_ROW', '2'))
         }
     
     # 로컬 환경에서는 config.json 사용
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+    if os.path.exists(branch.config_file):
+        with open(branch.config_file, 'r', encoding='utf-8') as f:
             return json.load(f)
     
     # 기본값
@@ -73,176 +340,479 @@ def load_config():
         "start_row": 2
     }
 
-def read_students():
-    """학생 목록 읽기"""
-    config = load_config()
+def parse_status(value):
+    """상태 셀 값을 0/1 정수로 변환"""
+    if value is None:
+        return 0
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+def read_students(branch=None):
+    """학생 목록 읽기 (엑셀 파일이 바뀌지 않았으면 캐시 사용)"""
+    branch = branch or current_branch()
+    config = load_config(branch)
+    roster_cache = branch.roster_cache
     
     # Excel 파일이 없으면 빈 목록 반환
-    if not os.path.exists(EXCEL_FILE):
-        print(f"Excel 파일이 없습니다: {EXCEL_FILE}")
+    excel_key = _file_key(branch.excel_file)
+    if excel_key is None:
+        log('excel.missing', "Excel 파일이 없습니다", level='warning', excel_file=branch.excel_file)
         return []
     
+    key = (excel_key, branch.config_cache['key'])
+    if roster_cache['key'] == key:
+        return roster_cache['students']
+    
+    # 여러 요청이 동시에 같은 엑셀을 다시 읽지 않도록 한 번만 읽음
+    with branch.load_lock:
+        roster_cache = branch.roster_cache
+        if roster_cache['key'] == key:
+            return roster_cache['students']
+        return _load_roster(branch, config, key)
+
+def _load_roster(branch, config, key):
+    """엑셀에서 학생 목록을 읽어 캐시에 넣음"""
     try:
-        wb = openpyxl.load_workbook(EXCEL_FILE)
+        import openpyxl
+        from openpyxl.utils import column_index_from_string
+        
+        # 읽기 전용 모드로 행 단위 순회 (셀 단위 접근보다 훨씬 빠름)
+        wb = openpyxl.load_workbook(branch.excel_file, read_only=True)
         ws = wb.active
         
+        name_idx = column_index_from_string(config['name_column']) - 1
+        phone_idx = column_index_from_string(config['phone_column']) - 1
+        status_idx = column_index_from_string(config['status_column']) - 1
+        payment_idx = column_index_from_string(config['payment_column']) - 1
+        id_idx = column_index_from_string(config['id_column']) - 1 if config.get('id_column') else None
+        width = max(name_idx, phone_idx, status_idx, payment_idx, id_idx or 0) + 1
+        
         students = []
         row = config['start_row']
         
-        while True:
-            name_cell = f"{config['name_column']}{row}"
-            phone_cell = f"{config['phone_column']}{row}"
-            status_cell = f"{config['status_column']}{row}"
-            payment_cell = f"{config['payment_column']}{row}"
-            
-            name = ws[name_cell].value
+        for values in ws.iter_rows(min_row=row, max_col=width, values_only=True):
+            values = tuple(values) + (None,) * (width - len(values))
+            name = values[name_idx]
             
             if not name:
                 break
             
-            phone = ws[phone_cell].value
-            status = ws[status_cell].value
-            payment_date = ws[payment_cell].value
+            raw_phone = values[phone_idx]
+            phone = normalize_phone(raw_phone)
+            payment_date = values[payment_idx]
+            student_id = str(values[id_idx]).strip() if id_idx is not None and values[id_idx] is not None else ''
             
-            if status is None:
-                status = 0
-            else:
-                try:
-                    status = int(status)
-                except:
-                    status = 0
-            
-            students.append({
-                'row': row,
-                'name': name,
-                'phone': str(phone) if phone else '',
-                'status': status,
-                'payment_date': payment_date,
-                'payment_status': '납입완료' if payment_date else '미납'
-            })
+            students.append(Student(
+                row,
+                name,
+                phone or (str(raw_phone).strip() if raw_phone else ''),
+                parse_status(values[status_idx]),
+                payment_date,
+                phone_valid=phone is not None,
+                student_id=student_id or None
+            ))
             
             row += 1
         
         wb.close()
+        by_name = {}
+        by_phone = {}
+        by_id = {}
+        for s in students:
+            by_name.setdefault(s.name, []).append(s)
+            if s.phone_valid:
+                by_phone.setdefault(s.phone, []).append(s)
+            if s.student_id:
+                by_id.setdefault(s.student_id, []).append(s)
+        branch.roster_cache = {
+            'key': key,
+            'students': students,
+            'by_row': {s.row: s for s in students},
+            'by_name': by_name,
+            'by_phone': by_phone,
+            # 행을 복사해 ID가 겹친 학생은 ID로 찾지 않음 (다른 학생으로 처리되지 않도록)
+            'by_id': {student_id: group[0] for student_id, group in by_id.items() if len(group) == 1},
+            'json': None,
+            'etag': None
+        }
         return students
         
     except Exception as e:
-        print(f"엑셀 파일 읽기 오류: {e}")
-        return []
+        # 읽기 실패 시 마지막으로 읽은 목록 유지
+        log('roster.read_error', "엑셀 파일 읽기 오류", level='error', excel_file=branch.excel_file, error=str(e))
+        return branch.roster_cache['students']
+
+def find_student(row):
+    """행 번호로 학생 찾기 (없으면 None)"""
+    branch = current_branch()
+    read_students(branch)
+    return branch.roster_cache['by_row'].get(row)
+
+def find_students_by_name(name):
+    """이름으로 학생 찾기 (동명이인이 있으면 여러 명)"""
+    branch = current_branch()
+    read_students(branch)
+    return branch.roster_cache['by_name'].get(name, [])
 
-def update_status(row, new_status):
-    """학생 상태 업데이트"""
+def find_students_by_phone(phone):
+    """연락처로 학생 찾기 (형제가 같은 번호를 쓰면 여러 명)"""
+    branch = current_branch()
+    read_students(branch)
+    return branch.roster_cache['by_phone'].get(normalize_phone(phone), [])
+
+def find_student_by_id(student_id):
+    """학생 ID로 학생 찾기 (id_column 설정 시)"""
+    branch = current_branch()
+    read_students(branch)
+    return branch.roster_cache['by_id'].get(student_id)
+
+def new_student_id():
+    """QR 코드용 학생 ID (이름과 무관한 임의 값)"""
+    return secrets.token_hex(5)
+
+def assign_student_ids(branch=None):
+    """
+    id_column 이 설정돼 있으면 ID가 없는 학생에게 새 ID를 만들어 엑셀에 기록
+    
+    QR 코드를 만들기 전에 호출한다. 한 번 기록된 ID는 이름이 바뀌어도 그대로라
+    인쇄해 둔 QR 코드를 계속 쓸 수 있다.
+    
+    Returns:
+        int: 새로 ID를 기록한 학생 수
+    """
+    branch = branch or current_branch()
+    config = load_config(branch)
+    id_column = config.get('id_column')
+    if not id_column:
+        return 0
+    missing = [s for s in read_students(branch) if not s.student_id]
+    if not missing:
+        return 0
+    
+    assigned = 0
+    try:
+        import openpyxl
+        with workbook_lock(branch):
+            wb = openpyxl.load_workbook(branch.excel_file)
+            ws = wb.active
+            
+            header = ws[f"{id_column}{config['start_row'] - 1}"] if config['start_row'] > 1 else None
+            if header is not None and header.value is None:
+                header.value = '학생ID'
+            
+            for student in missing:
+                cell = ws[f"{id_column}{student.row}"]
+                if row_changed(ws, config, student.row, student) or cell.value:
+                    continue
+                cell.value = new_student_id()
+                cell.number_format = '@'
+                assigned += 1
+            
+            if assigned:
+                save_workbook(wb, branch)
+            wb.close()
+    except Exception as e:
+        # 기록하지 못하면 이번에는 이름으로 QR 코드를 만든다
+        log('roster.id_assign_error', "학생 ID 기록 오류", level='error', excel_file=branch.excel_file, error=str(e))
+        return 0
+    if assigned:
+        invalidate_roster_cache(branch)
+    return assigned
+
+def students_json():
+    """
+    /api/students 응답 본문과 ETag
+    
+    학생 목록이 바뀔 때만 한 번 직렬화하고, ETag는 엑셀 파일 키와 설정 키로 만들어
+    워커가 달라도 같은 목록이면 같은 값이 나온다. (설정의 열 위치 등이 바뀌면 ETag도 바뀜)
+    """
+    branch = current_branch()
+    read_students(branch)
+    roster_cache = branch.roster_cache
+    if roster_cache['json'] is None or roster_cache['key'] is None:
+        body = app.json.dumps([s.to_dict() for s in roster_cache['students']]).encode('utf-8')
+        if roster_cache['key'] is None:
+            return body, None
+        (mtime_ns, size), config_key = roster_cache['key']
+        config_hash = zlib.crc32(repr(config_key).encode('utf-8'))
+        # 같은 캐시 dict에 두 값을 함께 기록 (동시에 만들어도 결과는 같음)
+        roster_cache.update(json=body, etag=f"{mtime_ns:x}-{size:x}-{config_hash:x}")
+    return roster_cache['json'], roster_cache['etag']
+
+def row_changed(ws, config, row, student):
+    """
+    잠금 안에서 행의 학생이 바뀌었는지 확인
+    
+    학생을 찾은 뒤 잠금을 얻기 전에 다른 요청이 학생을 삭제하면 행이 밀리므로,
+    행을 수정/삭제하기 전에 이름을 다시 확인한다.
+    """
+    return ws[f"{config['name_column']}{row}"].value != student.name
+
+def row_conflict(student):
+    """row_changed 일 때의 응답"""
+    return jsonify({'success': False,
+                    'message': f"{student.name}님의 정보가 변경되었습니다. 새로고침 후 다시 시도해주세요."}), 409
+
+def update_status(row, new_status, name=None):
+    """
+    학생 상태 업데이트
+    
+    잠금 안에서 현재 값을 다시 확인해, 다른 요청이 먼저 같은 상태로 바꿨거나
+    (name 지정 시) 행의 학생이 바뀌었으면 저장하지 않는다.
+    
+    Returns:
+        True: 변경됨, None: 이미 처리됨(변경 없음), False: 오류
+    """
     config = load_config()
     
     try:
-        wb = openpyxl.load_workbook(EXCEL_FILE)
-        ws = wb.active
-        
-        status_cell = f"{config['status_column']}{row}"
-        ws[status_cell].value = new_status
-        
-        wb.save(EXCEL_FILE)
-        wb.close()
+        import openpyxl
+        with workbook_lock():
+            wb = openpyxl.load_workbook(current_branch().excel_file)
+            ws = wb.active
+            
+            status_cell = f"{config['status_column']}{row}"
+            current_name = ws[f"{config['name_column']}{row}"].value
+            if parse_status(ws[status_cell].value) == new_status or (name and current_name != name):
+                wb.close()
+                return None
+            ws[status_cell].value = new_status
+            
+            save_workbook(wb)
+            wb.close()
+        invalidate_roster_cache()
         return True
         
     except Exception as e:
-        print(f"상태 업데이트 오류: {e}")
+        log('roster.update_error', "상태 업데이트 오류", level='error', row=row, error=str(e))
         return False
 
-# 앱 시작 시 Excel 파일 초기화 (Gunicorn 실행 시에도 작동)
-init_excel_file()
+# 같은 번호(형제)로 가는 등원/하원 알림을 이 시간(초) 동안 모았다가 한 건으로 보냄 (0이면 바로 전송)
+NOTIFY_MERGE_SECONDS = float(os.getenv('NOTIFY_MERGE_SECONDS', '5'))
+
+# 모으는 중인 알림 {(지점, 번호, 종류): {'message_id', 'names', 'expires', 'lock'}}
+# 딕셔너리는 _pending_notifications_lock, 항목 내용과 메시지 기록 변경은 항목의 lock으로 보호
+_pending_notifications = {}
+_pending_notifications_lock = threading.Lock()
+
+def _mergeable(pending, names, now):
+    """아직 묶을 수 있는 알림인지 (같은 학생이 다시 들어온 경우(등원→하원→등원)는 따로 보냄)"""
+    return pending is not None and pending['expires'] > now and not set(names) & set(pending['names'])
+
+def _reserved_entry(names, expires):
+    """잠근 상태의 새 알림 항목 (메시지를 기록하기 전에 등록해 동시에 들어온 형제 알림이 기다렸다 묶이도록)"""
+    entry = {'message_id': None, 'names': list(names), 'expires': expires, 'lock': threading.Lock()}
+    entry['lock'].acquire()
+    return entry
+
+def notify_status_change(phone, names, kind):
+    """
+    등원/하원 알림 예약
+    
+    명단에서 같은 번호를 쓰는 학생(형제)이 있으면 NOTIFY_MERGE_SECONDS 동안 기다리며,
+    그 사이 들어온 같은 종류의 알림은 아직 전송 전인 메시지에 이름을 더해 한 건으로 보낸다.
+    번호를 쓰는 학생이 한 명뿐이면 기다리지 않고 바로 보낸다.
+    (워커 프로세스가 여러 개면 같은 워커로 들어온 알림끼리만 묶인다)
+    
+    묶을지 새로 보낼지는 _pending_notifications_lock 안에서 정하고,
+    메시지 기록(SQLite) 저장/변경은 그 잠금 밖에서 항목별 lock을 잡고 한다.
+    
+    Returns:
+        str 또는 None: 전송 기록 ID
+    """
+    branch = current_branch()
+    templates = load_templates(branch)
+    key = (branch.id, phone, kind)
+    delay = NOTIFY_MERGE_SECONDS if len(find_students_by_phone(phone)) > 1 else 0
+    now = time.time()
+    
+    entry = None
+    with _pending_notifications_lock:
+        # 기간이 지난 항목 정리
+        for expired in [k for k, v in _pending_notifications.items() if v['expires'] <= now]:
+            del _pending_notifications[expired]
+        
+        pending = _pending_notifications.get(key)
+        if not _mergeable(pending, names, now):
+            pending = None
+            if delay > 0:
+                entry = _pending_notifications[key] = _reserved_entry(names, now + delay)
+    
+    if pending is not None:
+        # 먼저 등록한 요청이 메시지를 기록할 때까지 기다렸다가 이름을 더함
+        with pending['lock']:
+            if pending['message_id'] and _mergeable(pending, names, time.time()):
+                merged = pending['names'] + list(names)
+                rendered = templates.render(kind, merged)
+                if amend_queued_sms(pending['message_id'], rendered.text, ', '.join(merged), rendered.msg_type):
+                    pending['names'] = merged
+                    return pending['message_id']
+        # 이미 전송 대기열로 넘어갔으면 새로 보내고, 이후 알림은 새 메시지에 묶음
+        if delay > 0:
+            with _pending_notifications_lock:
+                if _pending_notifications.get(key) is pending:
+                    entry = _pending_notifications[key] = _reserved_entry(names, time.time() + delay)
+    
+    message_id = None
+    try:
+        rendered = templates.render(kind, names)
+        message_id = enqueue_sms(phone, rendered.text,
+                                 student_name=', '.join(names),
+                                 config_file=branch.sms_config_file,
+                                 delay=delay,
+                                 msg_type=rendered.msg_type,
+                                 template_code=rendered.template_code) or None
+    finally:
+        if entry is not None:
+            entry['message_id'] = message_id
+            entry['lock'].release()
+    
+    return message_id
+
+def create_app():
+    """
+    앱 팩토리: 파일 초기화와 캐시 예열을 명시적으로 수행
+    
+    gunicorn --preload "web_app:create_app()" 로 실행하면 마스터 프로세스에서
+    한 번만 호출되고, 읽어 둔 설정/학생 목록은 fork된 워커들이 copy-on-write로 공유한다.
+    """
+    started = time.perf_counter()
+    
+    # Excel 파일 초기화 (없으면 생성)
+    init_excel_file(DEFAULT_BRANCH)
+    DEFAULT_BRANCH.initialized = True
+    
+    # 무거운 모듈과 설정/학생 목록을 미리 로드
+    import openpyxl  # noqa: F401
+    load_config(DEFAULT_BRANCH)
+    students = read_students(DEFAULT_BRANCH)
+    
+    now = time.perf_counter()
+    log('app.started', "[시작] 앱 준비 완료",
+        import_ms=round((started - _import_started) * 1000, 1),
+        init_ms=round((now - started) * 1000, 1),
+        students=len(students))
+    return app
+
+@app.before_request
+def _mark_request_started():
+    g.request_started = time.perf_counter()
 
-@app.route('/')
+@app.after_request
+def _report_first_request(response):
+    """워커의 첫 요청 처리 시간 보고 (프로세스별 1회, create_app 없이 실행해도 보고)"""
+    if _startup['first_request_pid'] != os.getpid():
+        _startup['first_request_pid'] = os.getpid()
+        started = g.get('request_started')
+        if started is not None:
+            log('app.first_request', "[시작] 첫 요청 완료", path=request.path,
+                duration_ms=round((time.perf_counter() - started) * 1000, 1))
+    return response
+
+@route('/')
 def index():
     """메인 페이지"""
     config = load_config()
     students = read_students()
     return render_template('index.html', 
                          students=students, 
-                         academy_name=config.get('academy_name', 'OO학원'))
+                         academy_name=config.get('academy_name', 'OO학원'),
+                         base_path=current_branch().base_path)
 
-@app.route('/api/students')
+@route('/api/students')
 def get_students():
-    """학생 목록 API"""
-    students = read_students()
-    return jsonify(students)
+    """학생 목록 API (목록이 그대로면 304)"""
+    body, etag = students_json()
+    
+    if etag and request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+    return response
 
-@app.route('/api/checkin/<int:row>', methods=['POST'])
+@route('/api/checkin/<int:row>', methods=['POST'])
 def checkin(row):
     """등원 처리 API"""
-    config = load_config()
-    students = read_students()
-    
     # 해당 학생 찾기
-    student = next((s for s in students if s['row'] == row), None)
+    student = find_student(row)
     
     if not student:
         return jsonify({'success': False, 'message': '학생을 찾을 수 없습니다.'}), 404
     
     # 이미 등원중인지 확인
-    if student['status'] == 1:
-        return jsonify({'success': False, 'message': f"{student['name']}님은 이미 등원중입니다."})
+    if student.status == 1:
+        return jsonify({'success': False, 'message': f"{student.name}님은 이미 등원중입니다."})
     
     # 상태 업데이트
-    if update_status(row, 1):
+    updated = update_status(row, 1, name=student.name)
+    if updated is None:
+        return jsonify({'success': False, 'message': f"{student.name}님은 이미 등원중입니다."})
+    if updated:
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        message = f'"{student["name"]}"님이 "{config.get("academy_name", "OO학원")}"에 등원하였습니다.'
+        message = load_templates().render('checkin', [student.name]).text
         
-        # 메시지 전송
-        if student['phone']:
-            send_sms(student['phone'], message, student_name=student['name'])
+        # 메시지 전송 (형제 알림은 묶어서, 올바르지 않은 번호는 전송하지 않음)
+        message_id = None
+        if student.phone:
+            message_id = notify_status_change(student.phone, [student.name], 'checkin')
         
         return jsonify({
             'success': True, 
-            'message': f"{student['name']}님 등원 처리 완료",
+            'message': f"{student.name}님 등원 처리 완료",
             'timestamp': timestamp,
-            'notification': message
+            'notification': message,
+            'message_id': message_id
         })
     else:
         return jsonify({'success': False, 'message': '상태 업데이트 실패'}), 500
 
-@app.route('/api/checkout/<int:row>', methods=['POST'])
+@route('/api/checkout/<int:row>', methods=['POST'])
 def checkout(row):
     """하원 처리 API"""
-    config = load_config()
-    students = read_students()
-    
     # 해당 학생 찾기
-    student = next((s for s in students if s['row'] == row), None)
+    student = find_student(row)
     
     if not student:
         return jsonify({'success': False, 'message': '학생을 찾을 수 없습니다.'}), 404
     
     # 이미 하원 상태인지 확인
-    if student['status'] == 0:
-        return jsonify({'success': False, 'message': f"{student['name']}님은 이미 하원 상태입니다."})
+    if student.status == 0:
+        return jsonify({'success': False, 'message': f"{student.name}님은 이미 하원 상태입니다."})
     
     # 상태 업데이트
-    if update_status(row, 0):
+    updated = update_status(row, 0, name=student.name)
+    if updated is None:
+        return jsonify({'success': False, 'message': f"{student.name}님은 이미 하원 상태입니다."})
+    if updated:
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        message = f'"{student["name"]}"님이 "{config.get("academy_name", "OO학원")}"에서 하원하였습니다.'
+        message = load_templates().render('checkout', [student.name]).text
         
-        # 메시지 전송
-        if student['phone']:
-            send_sms(student['phone'], message, student_name=student['name'])
+        # 메시지 전송 (형제 알림은 묶어서, 올바르지 않은 번호는 전송하지 않음)
+        message_id = None
+        if student.phone:
+            message_id = notify_status_change(student.phone, [student.name], 'checkout')
         
         return jsonify({
             'success': True, 
-            'message': f"{student['name']}님 하원 처리 완료",
+            'message': f"{student.name}님 하원 처리 완료",
             'timestamp': timestamp,
-            'notification': message
+            'notification': message,
+            'message_id': message_id
         })
     else:
         return jsonify({'success': False, 'message': '상태 업데이트 실패'}), 500
 
-@app.route('/api/payment/<int:row>', methods=['POST'])
+@route('/api/payment/<int:row>', methods=['POST'])
 def register_payment(row):
     """원비 납입 등록 API"""
     config = load_config()
-    students = read_students()
     
     # 해당 학생 찾기
-    student = next((s for s in students if s['row'] == row), None)
+    student = find_student(row)
     
     if not student:
         return jsonify({'success': False, 'message': '학생을 찾을 수 없습니다.'}), 404
@@ -253,83 +823,142 @@ def register_payment(row):
     
     # 납입 정보 업데이트
     try:
-        wb = openpyxl.load_workbook(EXCEL_FILE)
-        ws = wb.active
-        
-        payment_cell = f"{config['payment_column']}{row}"
-        ws[payment_cell].value = payment_date
-        
-        wb.save(EXCEL_FILE)
-        wb.close()
+        import openpyxl
+        with workbook_lock():
+            wb = openpyxl.load_workbook(current_branch().excel_file)
+            ws = wb.active
+            
+            if row_changed(ws, config, row, student):
+                wb.close()
+                return row_conflict(student)
+            
+            payment_cell = f"{config['payment_column']}{row}"
+            ws[payment_cell].value = payment_date
+            
+            save_workbook(wb)
+            wb.close()
+        invalidate_roster_cache()
         
         if payment_date:
             return jsonify({
                 'success': True,
-                'message': f"{student['name']}님 원비 납입 등록 완료",
+                'message': f"{student.name}님 원비 납입 등록 완료",
                 'payment_date': payment_date
             })
         else:
             return jsonify({
                 'success': True,
-                'message': f"{student['name']}님 납입 정보 삭제 완료"
+                'message': f"{student.name}님 납입 정보 삭제 완료"
             })
             
     except Exception as e:
         return jsonify({'success': False, 'message': f'업데이트 오류: {e}'}), 500
 
-@app.route('/api/send_message/<int:row>', methods=['POST'])
+@route('/api/send_message/<int:row>', methods=['POST'])
 def send_message(row):
     """메시지 수동 발송 API"""
-    config = load_config()
-    students = read_students()
-    
     # 해당 학생 찾기
-    student = next((s for s in students if s['row'] == row), None)
+    student = find_student(row)
     
     if not student:
         return jsonify({'success': False, 'message': '학생을 찾을 수 없습니다.'}), 404
     
-    if not student['phone']:
+    if not student.phone:
         return jsonify({'success': False, 'message': '연락처가 없습니다.'}), 400
     
+    if not student.phone_valid:
+        return jsonify({'success': False, 'message': f'연락처가 올바르지 않습니다: {student.phone}'}), 400
+    
     # 메시지 타입 가져오기
     data = request.get_json()
     msg_type = data.get('type')  # 'checkin', 'checkout', 'payment_request'
     custom_message = data.get('message', '')
     
-    academy_name = config.get('academy_name', 'OO학원')
-    
-    # 메시지 생성
-    if msg_type == 'checkin':
-        message = f'"{student["name"]}"님이 "{academy_name}"에 등원하였습니다.'
-    elif msg_type == 'checkout':
-        message = f'"{student["name"]}"님이 "{academy_name}"에서 하원하였습니다.'
+    # 메시지 생성 (길이에 따라 SMS/LMS 결정)
+    if msg_type in ('checkin', 'checkout'):
+        rendered = load_templates().render(msg_type, [student.name])
     elif msg_type == 'payment_request':
         if custom_message:
-            message = custom_message
+            rendered = plain_message(custom_message)
         else:
-            message = f'안녕하세요, {academy_name}입니다.\n{student["name"]}님의 이번 달 원비 납입을 부탁드립니다.'
+            rendered = load_templates().render('payment_request', [student.name])
     else:
         return jsonify({'success': False, 'message': '잘못된 메시지 타입입니다.'}), 400
     
+    if rendered.byte_length > LMS_MAX_BYTES:
+        return jsonify({'success': False,
+                        'message': f'메시지가 너무 깁니다 ({rendered.byte_length}바이트, 최대 {LMS_MAX_BYTES}바이트)'}), 400
+    
     # 메시지 발송
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    send_sms(student['phone'], message, student_name=student['name'])
+    message_id = enqueue_sms(student.phone, rendered.text, student_name=student.name,
+                             config_file=current_branch().sms_config_file,
+                             msg_type=rendered.msg_type, template_code=rendered.template_code)
     
     return jsonify({
         'success': True,
-        'message': f"{student['name']}님에게 메시지 발송 완료",
-        'timestamp': timestamp
+        'message': f"{student.name}님에게 메시지 발송 완료",
+        'timestamp': timestamp,
+        'message_id': message_id or None,
+        'msg_type': rendered.msg_type,
+        'byte_length': rendered.byte_length
     })
 
-@app.route('/api/edit_phone/<int:row>', methods=['POST'])
+@route('/api/messages/<message_id>')
+def message_status(message_id):
+    """
+    메시지 전송/수신 결과 조회 API
+    
+    status: queued(발송 대기), sending(전송 중), test, pending(결과 대기), sent(조회 미지원), delivered, failed, unknown
+    ?refresh=1 이면 결과 대기중인 메시지를 즉시 프로바이더에 조회한다.
+    """
+    record = get_message(message_id)
+    
+    # 다른 지점의 전송 기록(번호, 내용)은 보이지 않음
+    if not record or record['config_file'] != current_branch().sms_config_file:
+        return jsonify({'success': False, 'message': '메시지를 찾을 수 없습니다.'}), 404
+    
+    if record['status'] == 'pending' and request.args.get('refresh') == '1':
+        poll_delivery_results(message_ids=[message_id])
+        record = get_message(message_id)
+    
+    return jsonify({'success': True, 'data': record})
+
+# 알림 감사 기록 조회 최대 건수
+AUDIT_QUERY_LIMIT = 500
+
+@route('/api/audit')
+def audit_log():
+    """
+    최근 알림 감사 기록 조회 API (현재 지점 기록만, 최신순)
+    
+    ?limit=50&student=홍길동&status=failed
+    status는 전송 시점의 결과이며, 최종 수신 결과는 /api/messages/<id> 로 확인한다.
+    """
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return jsonify({'success': False, 'message': '잘못된 limit 값입니다.'}), 400
+    limit = min(limit, AUDIT_QUERY_LIMIT)
+    
+    filters = {'config_file': current_branch().sms_config_file}
+    if request.args.get('student'):
+        filters['student_name'] = request.args['student']
+    if request.args.get('status'):
+        filters['status'] = request.args['status']
+    
+    entries = recent_audit(limit=limit, **filters)
+    return jsonify({'success': True, 'data': entries})
+
+@route('/api/edit_phone/<int:row>', methods=['POST'])
 def edit_phone(row):
     """연락처 수정 API"""
     config = load_config()
-    students = read_students()
     
     # 해당 학생 찾기
-    student = next((s for s in students if s['row'] == row), None)
+    student = find_student(row)
     
     if not student:
         return jsonify({'success': False, 'message': '학생을 찾을 수 없습니다.'}), 404
@@ -341,27 +970,40 @@ def edit_phone(row):
     if not new_phone or not new_phone.strip():
         return jsonify({'success': False, 'message': '연락처를 입력해주세요.'}), 400
     
+    phone = normalize_phone(new_phone)
+    if phone is None:
+        return jsonify({'success': False, 'message': f'올바른 휴대폰 번호가 아닙니다: {new_phone.strip()}'}), 400
+    
     # 연락처 업데이트
     try:
-        wb = openpyxl.load_workbook(EXCEL_FILE)
-        ws = wb.active
-        
-        phone_cell = f"{config['phone_column']}{row}"
-        ws[phone_cell].value = new_phone.strip()
-        
-        wb.save(EXCEL_FILE)
-        wb.close()
+        import openpyxl
+        with workbook_lock():
+            wb = openpyxl.load_workbook(current_branch().excel_file)
+            ws = wb.active
+            
+            if row_changed(ws, config, row, student):
+                wb.close()
+                return row_conflict(student)
+            
+            # 정규 형식 문자열로 저장 (숫자 셀이 되면 앞의 0이 빠짐)
+            phone_cell = ws[f"{config['phone_column']}{row}"]
+            phone_cell.value = phone
+            phone_cell.number_format = '@'
+            
+            save_workbook(wb)
+            wb.close()
+        invalidate_roster_cache()
         
         return jsonify({
             'success': True,
-            'message': f"{student['name']}님 연락처 수정 완료",
-            'new_phone': new_phone.strip()
+            'message': f"{student.name}님 연락처 수정 완료",
+            'new_phone': phone
         })
             
     except Exception as e:
         return jsonify({'success': False, 'message': f'수정 오류: {e}'}), 500
 
-@app.route('/api/add_student', methods=['POST'])
+@route('/api/add_student', methods=['POST'])
 def add_student():
     """학생 등록 API"""
     config = load_config()
@@ -378,32 +1020,44 @@ def add_student():
     if not phone or not phone.strip():
         return jsonify({'success': False, 'message': '연락처를 입력해주세요.'}), 400
     
+    normalized_phone = normalize_phone(phone)
+    if normalized_phone is None:
+        return jsonify({'success': False, 'message': f'올바른 휴대폰 번호가 아닙니다: {phone.strip()}'}), 400
+    phone = normalized_phone
+    
     # 엑셀에 추가
     try:
-        wb = openpyxl.load_workbook(EXCEL_FILE)
-        ws = wb.active
-        
-        # 마지막 행 찾기
-        last_row = config['start_row']
-        while ws[f"{config['name_column']}{last_row}"].value:
-            last_row += 1
-        
-        # 새 학생 정보 입력
-        ws[f"{config['name_column']}{last_row}"].value = name.strip()
-        ws[f"{config['phone_column']}{last_row}"].value = phone.strip()
-        ws[f"{config['status_column']}{last_row}"].value = 0  # 하원 상태
-        if payment_date and payment_date.strip():
-            ws[f"{config['payment_column']}{last_row}"].value = payment_date.strip()
-        
-        wb.save(EXCEL_FILE)
-        wb.close()
+        import openpyxl
+        with workbook_lock():
+            wb = openpyxl.load_workbook(current_branch().excel_file)
+            ws = wb.active
+            
+            # 마지막 행 찾기
+            last_row = config['start_row']
+            while ws[f"{config['name_column']}{last_row}"].value:
+                last_row += 1
+            
+            # 새 학생 정보 입력
+            ws[f"{config['name_column']}{last_row}"].value = name.strip()
+            ws[f"{config['phone_column']}{last_row}"].value = phone
+            ws[f"{config['phone_column']}{last_row}"].number_format = '@'
+            ws[f"{config['status_column']}{last_row}"].value = 0  # 하원 상태
+            if payment_date and payment_date.strip():
+                ws[f"{config['payment_column']}{last_row}"].value = payment_date.strip()
+            if config.get('id_column'):
+                ws[f"{config['id_column']}{last_row}"].value = new_student_id()
+                ws[f"{config['id_column']}{last_row}"].number_format = '@'
+            
+            save_workbook(wb)
+            wb.close()
+        invalidate_roster_cache()
         
         return jsonify({
             'success': True,
             'message': f"{name}님 등록 완료",
             'student': {
                 'name': name.strip(),
-                'phone': phone.strip(),
+                'phone': phone,
                 'payment_date': payment_date.strip() if payment_date else None
             }
         })
@@ -411,49 +1065,350 @@ def add_student():
     except Exception as e:
         return jsonify({'success': False, 'message': f'등록 오류: {e}'}), 500
 
-@app.route('/api/delete_student/<int:row>', methods=['DELETE'])
+@route('/api/delete_student/<int:row>', methods=['DELETE'])
 def delete_student(row):
     """학생 삭제 API"""
     config = load_config()
-    students = read_students()
     
     # 해당 학생 찾기
-    student = next((s for s in students if s['row'] == row), None)
+    student = find_student(row)
     
     if not student:
         return jsonify({'success': False, 'message': '학생을 찾을 수 없습니다.'}), 404
     
     # 엑셀에서 삭제
     try:
-        wb = openpyxl.load_workbook(EXCEL_FILE)
-        ws = wb.active
-        
-        # 해당 행 삭제
-        ws.delete_rows(row, 1)
-        
-        wb.save(EXCEL_FILE)
-        wb.close()
+        import openpyxl
+        with workbook_lock():
+            wb = openpyxl.load_workbook(current_branch().excel_file)
+            ws = wb.active
+            
+            if row_changed(ws, config, row, student):
+                wb.close()
+                return row_conflict(student)
+            
+            # 해당 행 삭제
+            ws.delete_rows(row, 1)
+            
+            save_workbook(wb)
+            wb.close()
+        invalidate_roster_cache()
         
         return jsonify({
             'success': True,
-            'message': f"{student['name']}님 삭제 완료"
+            'message': f"{student.name}님 삭제 완료"
         })
             
     except Exception as e:
         return jsonify({'success': False, 'message': f'삭제 오류: {e}'}), 500
 
-@app.route('/mobile')
+# /api/sync 에서 처리하는 오프라인 작업 종류
+SYNC_OPERATIONS = ('checkin', 'checkout', 'payment')
+
+# 적용한 오프라인 작업 ID 보관 기간(초) - 응답을 받지 못한 기기가 같은 작업을 다시 보낼 때 확인
+SYNC_OP_RETENTION = 30 * 24 * 3600
+
+def _sync_ops_db(branch):
+    """
+    적용한 오프라인 작업 기록 (<엑셀 파일>.sync.db)
+    
+    workbook_lock 안에서만 읽고 쓰므로 엑셀 저장과 같은 순서로 기록된다.
+    """
+    conn = sqlite3.connect(branch.excel_file + '.sync.db', timeout=10)
+    conn.execute("CREATE TABLE IF NOT EXISTS applied_ops "
+                 "(id TEXT PRIMARY KEY, result TEXT NOT NULL, applied_at REAL NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS applied_ops_time ON applied_ops (applied_at)")
+    return conn
+
+def _sync_op_id(op):
+    """재전송 확인에 쓸 작업 ID (없거나 이상하면 None)"""
+    op_id = op.get('id')
+    return op_id if isinstance(op_id, str) and 0 < len(op_id) <= 200 else None
+
+def apply_sync_operation(ws, config, op, notifications):
+    """
+    오프라인 대기열 작업 하나를 워크시트에 반영
+    
+    행 번호가 가리키는 학생 이름이 다르거나(삭제로 행이 밀린 경우),
+    이미 같은 상태인 경우는 충돌(conflict)로 보고 반영하지 않는다.
+    등원/하원 알림은 (번호, 종류, 이름)으로 notifications 에 모아 저장 후 한 번에 보낸다.
+    
+    Returns:
+        dict: {'id', 'status': 'applied'|'conflict'|'error', 'message'}
+    """
+    op_id = op.get('id')
+    kind = op.get('op')
+    row = op.get('row')
+    name = op.get('name')
+    
+    if (kind not in SYNC_OPERATIONS or not isinstance(row, int) or isinstance(row, bool)
+            or not config['start_row'] <= row <= ws.max_row):
+        return {'id': op_id, 'status': 'error', 'message': '잘못된 작업입니다.'}
+    
+    current_name = ws[f"{config['name_column']}{row}"].value
+    if not current_name or (name and str(current_name) != name):
+        return {'id': op_id, 'status': 'conflict', 'message': f"{name or row}: 학생 정보가 변경되었습니다."}
+    
+    status_cell = ws[f"{config['status_column']}{row}"]
+    status = parse_status(status_cell.value)
+    
+    if kind == 'checkin':
+        if status == 1:
+            return {'id': op_id, 'status': 'conflict', 'message': f"{current_name}님은 이미 등원중입니다."}
+        status_cell.value = 1
+    elif kind == 'checkout':
+        if status == 0:
+            return {'id': op_id, 'status': 'conflict', 'message': f"{current_name}님은 이미 하원 상태입니다."}
+        status_cell.value = 0
+    else:
+        ws[f"{config['payment_column']}{row}"].value = op.get('payment_date') or None
+        return {'id': op_id, 'status': 'applied', 'message': f"{current_name}님 납입 정보 반영"}
+    
+    phone = ws[f"{config['phone_column']}{row}"].value
+    if phone:
+        notifications.append((normalize_phone(phone) or str(phone), kind, str(current_name)))
+    return {'id': op_id, 'status': 'applied', 'message': f"{current_name}님 처리 완료"}
+
+@route('/api/sync', methods=['POST'])
+def sync():
+    """
+    오프라인 대기열 일괄 동기화 API
+    
+    모바일 클라이언트가 쌓아 둔 등원/하원/납입 작업을 받은 순서대로 적용하고
+    엑셀은 한 번만 저장한다. 작업별 결과와 최신 학생 목록을 함께 돌려준다.
+    
+    응답을 받지 못한 기기가 같은 작업(같은 id)을 다시 보내면 다시 적용하거나
+    알림을 보내지 않고 처음 결과를 그대로 돌려준다.
+    """
+    config = load_config()
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations', []) if isinstance(data, dict) else None
+    
+    if not isinstance(operations, list):
+        return jsonify({'success': False, 'message': '잘못된 요청입니다.'}), 400
+    
+    results = []
+    notifications = []
+    
+    if operations:
+        try:
+            import openpyxl
+            branch = current_branch()
+            with workbook_lock():
+                ops_db = _sync_ops_db(branch)
+                try:
+                    op_ids = [_sync_op_id(op) for op in operations if isinstance(op, dict)]
+                    op_ids = [op_id for op_id in op_ids if op_id]
+                    done = {}
+                    if op_ids:
+                        placeholders = ','.join('?' * len(op_ids))
+                        done = {op_id: json.loads(result) for op_id, result in ops_db.execute(
+                            f"SELECT id, result FROM applied_ops WHERE id IN ({placeholders})", op_ids)}
+                    
+                    wb = openpyxl.load_workbook(branch.excel_file)
+                    ws = wb.active
+                    
+                    new_results = []
+                    for op in operations:
+                        if not isinstance(op, dict):
+                            results.append({'id': None, 'status': 'error', 'message': '잘못된 작업입니다.'})
+                            continue
+                        op_id = _sync_op_id(op)
+                        if op_id in done:
+                            # 이미 적용한 작업의 재전송
+                            results.append(dict(done[op_id], replayed=True))
+                            continue
+                        # 작업 하나의 오류로 나머지 작업(과 기기의 대기열 전체)이 막히지 않도록 작업별로 처리
+                        try:
+                            result = apply_sync_operation(ws, config, op, notifications)
+                        except Exception as e:
+                            log('sync.op_error', "동기화 작업 오류", level='warning', op=op.get('op'), error=str(e))
+                            result = {'id': op.get('id'), 'status': 'error', 'message': f'처리 오류: {e}'}
+                        results.append(result)
+                        if op_id:
+                            done[op_id] = result
+                            new_results.append((op_id, result))
+                    
+                    if any(r['status'] == 'applied' and not r.get('replayed') for r in results):
+                        save_workbook(wb)
+                        invalidate_roster_cache()
+                    wb.close()
+                    
+                    # 저장한 뒤에 기록 (저장 전에 실패하면 다시 보낸 작업을 새로 적용)
+                    now = time.time()
+                    with ops_db:
+                        ops_db.executemany("INSERT OR REPLACE INTO applied_ops (id, result, applied_at) VALUES (?, ?, ?)",
+                                           [(op_id, json.dumps(result, ensure_ascii=False), now)
+                                            for op_id, result in new_results])
+                        ops_db.execute("DELETE FROM applied_ops WHERE applied_at < ?", (now - SYNC_OP_RETENTION,))
+                finally:
+                    ops_db.close()
+            
+        except Exception as e:
+            return jsonify({'success': False, 'message': f'동기화 오류: {e}'}), 500
+    
+    # 저장이 끝난 뒤 메시지 전송 (같은 번호의 같은 종류 알림은 한 건으로)
+    # 같은 학생이 대기열에 두 번 있으면(등원→하원→등원) 변경마다 알림이 가도록 따로 보냄
+    groups = []
+    open_groups = {}
+    for phone, kind, name in notifications:
+        group = open_groups.get((phone, kind))
+        if group is None or name in group[2]:
+            group = (phone, kind, [])
+            groups.append(group)
+            open_groups[(phone, kind)] = group
+        group[2].append(name)
+    for phone, kind, names in groups:
+        notify_status_change(phone, names, kind)
+    
+    return jsonify({
+        'success': True,
+        'results': results,
+        'students': [s.to_dict() for s in read_students()],
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+# 같은 학생을 연속으로 스캔했을 때 무시하는 시간(초) - 등원 직후 하원되는 것 방지
+SCAN_DEBOUNCE_SECONDS = 10
+
+def record_scan(student, branch=None):
+    """
+    QR 스캔 기록 (SCAN_DEBOUNCE_SECONDS 안에 같은 학생을 이미 스캔했으면 False)
+    
+    워커가 여러 개여도 두 번 스캔이 각각 처리되지 않도록 학생별 마지막 스캔 시각을
+    <엑셀 파일>.scans.json 에 엑셀 잠금 안에서 확인/기록한다.
+    """
+    branch = branch or current_branch()
+    path = branch.excel_file + '.scans.json'
+    key = f"{branch.id}:{student.row}"
+    now = time.time()
+    
+    with workbook_lock(branch):
+        try:
+            with open(path, encoding='utf-8') as f:
+                scans = json.load(f)
+        except (OSError, ValueError):
+            scans = {}
+        if not isinstance(scans, dict):
+            scans = {}
+        
+        last = scans.get(key)
+        if isinstance(last, (int, float)) and now - last < SCAN_DEBOUNCE_SECONDS:
+            return False
+        
+        # 오래된 스캔 기록 정리
+        scans = {k: t for k, t in scans.items()
+                 if isinstance(t, (int, float)) and now - t < SCAN_DEBOUNCE_SECONDS}
+        scans[key] = now
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(scans, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log('scan.record_failed', "스캔 기록 저장 실패", level='warning', error=str(e))
+    return True
+
+@route('/api/scan', methods=['POST'])
+def scan():
+    """
+    QR 스캔 등원/하원 API (키오스크용)
+    
+    서명된 토큰을 검증한 뒤 현재 상태에 따라 등원 또는 하원 처리한다.
+    """
+    data = request.get_json(silent=True) or {}
+    token = data.get('token', '') if isinstance(data, dict) else ''
+    
+    subject = verify_token(token, current_branch().id)
+    if not subject:
+        return jsonify({'success': False, 'message': '유효하지 않은 QR 코드입니다.'}), 400
+    
+    # 학생 ID 토큰, 없으면 이름 토큰 (id_column 설정 전에 인쇄한 QR 코드)
+    student = find_student_by_id(subject)
+    if student is None:
+        students = find_students_by_name(subject)
+        if not students:
+            return jsonify({'success': False, 'message': '학생을 찾을 수 없습니다.'}), 404
+        if len(students) > 1:
+            return jsonify({'success': False, 'message': f"{subject}: 동명이인이 있어 직원 확인이 필요합니다."}), 409
+        student = students[0]
+    
+    if not record_scan(student):
+        return jsonify({'success': False, 'message': f"{student.name}님은 방금 처리되었습니다."})
+    
+    # 다른 워커에서 방금 바뀐 상태도 반영되도록 기록 후 다시 읽음
+    student = find_student(student.row) or student
+    if student.status == 1:
+        return checkout(student.row)
+    return checkin(student.row)
+
+@route('/qr/<int:row>.png')
+def student_qr(row):
+    """학생 QR 이미지 (디스크에 만들어 둔 파일 제공)"""
+    assign_student_ids()
+    student = find_student(row)
+    
+    if not student:
+        return jsonify({'success': False, 'message': '학생을 찾을 수 없습니다.'}), 404
+    
+    try:
+        path = generate_qr_png(student.qr_subject, current_branch().id)
+    except ImportError:
+        return jsonify({'success': False, 'message': 'qrcode 패키지가 설치되지 않았습니다. pip install qrcode[pil]'}), 503
+    
+    response = send_file(os.path.abspath(path), mimetype='image/png')
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+@route('/qr_sheet')
+def qr_sheet():
+    """QR 코드 인쇄용 페이지 (없는 이미지는 미리 생성)"""
+    config = load_config()
+    assign_student_ids()
+    students = read_students()
+    
+    try:
+        pregenerate_qr_codes((s.qr_subject for s in students), current_branch().id)
+    except ImportError:
+        return 'qrcode 패키지가 설치되지 않았습니다. pip install qrcode[pil]', 503
+    
+    return render_template('qr_sheet.html',
+                         students=students,
+                         academy_name=config.get('academy_name', 'OO학원'),
+                         base_path=current_branch().base_path)
+
+@route('/kiosk')
+def kiosk():
+    """입구 셀프 등원/하원 키오스크 페이지 (QR 스캐너 입력)"""
+    config = load_config()
+    return render_template('kiosk.html',
+                         academy_name=config.get('academy_name', 'OO학원'),
+                         base_path=current_branch().base_path)
+
+@app.route('/sw.js')
+def service_worker():
+    """모바일 오프라인 지원용 서비스 워커 (루트 범위로 제공)"""
+    response = app.send_static_file('sw.js')
+    response.headers['Content-Type'] = 'application/javascript; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@route('/mobile')
 def mobile():
     """모바일 최적화 페이지"""
     config = load_config()
     students = read_students()
     return render_template('mobile.html', 
                          students=students, 
-                         academy_name=config.get('academy_name', 'OO학원'))
+                         academy_name=config.get('academy_name', 'OO학원'),
+                         base_path=current_branch().base_path)
 
 if __name__ == '__main__':
-    # Excel 파일 초기화 (없으면 생성)
-    init_excel_file()
+    # Excel 파일 초기화 및 캐시 예열
+    create_app()
+    
+    # 이전 실행에서 결과를 기다리던 메시지도 조회 (gunicorn 은 post_fork 에서 시작)
+    start_delivery_poller()
     
     # Render 등 호스팅 서비스는 PORT 환경 변수를 제공
     port = int(os.getenv('PORT', 5000))